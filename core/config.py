@@ -1,15 +1,41 @@
+import os
+from functools import cached_property
+
+from pydantic import computed_field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     REPLICATE_API_TOKEN: str
     WEBHOOK_BASE_URL: str = ""
     REPLICATE_WEBHOOK_SECRET: str | None = None
+    # Comma-separated list of browser origins allowed by CORS.
+    FRONTEND_ORIGIN: str = "http://localhost:3000"
     SUPABASE_URL: str
     SUPABASE_SERVICE_ROLE_KEY: str
+    # Supavisor transaction-mode DSN (port 6543) for any direct Postgres client.
+    # PostgREST/Storage traffic keeps going through SUPABASE_URL.
+    SUPABASE_POOLER_URL: str | None = None
     SUPABASE_JWT_SECRET: str
     SUPABASE_JWT_AUDIENCE: str = "authenticated"
     SUPABASE_JWT_ALGORITHM: str = "HS256"
+    SUPABASE_JWT_ISSUER: str | None = None
+    # Level of the application loggers (`core.*`, `routers.*`).
+    LOG_LEVEL: str = "INFO"
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
+    @computed_field  # type: ignore[prop-decorator]
+    @cached_property
+    def WEBHOOK_URL(self) -> str:
+        """Replicate callback URL, built once from WEBHOOK_BASE_URL ("" when unset)."""
+        base = self.WEBHOOK_BASE_URL.rstrip("/")
+        return f"{base}/ai/webhooks/replicate" if base else ""
+
+    @model_validator(mode="after")
+    def _require_webhook_base_url_in_production(self) -> "Settings":
+        # K_SERVICE is set by Cloud Run: fail at startup rather than on every request.
+        if os.environ.get("K_SERVICE") and not self.WEBHOOK_BASE_URL.strip():
+            raise ValueError("WEBHOOK_BASE_URL must be set when running on Cloud Run")
+        return self
+
 settings = Settings()  # type: ignore[call-arg]
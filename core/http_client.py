@@ -0,0 +1,25 @@
+from functools import lru_cache
+
+import httpx
+
+
+@lru_cache(maxsize=1)
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return a singleton HTTP client for outbound downloads (Replicate delivery CDN).
+    Keep-alive connections are reused across webhooks instead of a TLS handshake each time.
+    """
+    return httpx.AsyncClient(
+        timeout=60.0,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client, if it was ever created."""
+    if not get_http_client.cache_info().currsize:
+        return
+    client = get_http_client()
+    get_http_client.cache_clear()
+    await client.aclose()
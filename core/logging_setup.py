@@ -0,0 +1,50 @@
+import logging
+import logging.handlers
+import queue
+from typing import Optional
+
+from core.config import settings
+
+# Application loggers (module `__name__`s live under these packages).
+_APP_LOGGERS = ("core", "routers")
+
+_LISTENER: Optional[logging.handlers.QueueListener] = None
+_QUEUE_HANDLER: Optional[logging.handlers.QueueHandler] = None
+
+
+def start_logging() -> None:
+    """
+    Route application log records through a QueueHandler: request handlers only
+    enqueue, and a QueueListener thread does the (blocking) stderr writes.
+    """
+    global _LISTENER, _QUEUE_HANDLER
+    if _LISTENER is not None:
+        return
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+    _LISTENER = logging.handlers.QueueListener(log_queue, stream_handler)
+
+    _QUEUE_HANDLER = logging.handlers.QueueHandler(log_queue)
+    for name in _APP_LOGGERS:
+        logger = logging.getLogger(name)
+        logger.setLevel(settings.LOG_LEVEL.upper())
+        logger.addHandler(_QUEUE_HANDLER)
+        logger.propagate = False
+
+    _LISTENER.start()
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread, if it was started."""
+    global _LISTENER, _QUEUE_HANDLER
+    if _LISTENER is None:
+        return
+    for name in _APP_LOGGERS:
+        logger = logging.getLogger(name)
+        logger.removeHandler(_QUEUE_HANDLER)
+        logger.propagate = True
+    _LISTENER.stop()
+    _LISTENER = None
+    _QUEUE_HANDLER = None
@@ -0,0 +1,93 @@
+from functools import lru_cache, wraps
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, TypeVar
+
+import httpx
+from fastapi import HTTPException
+
+from core.config import settings
+
+if TYPE_CHECKING:
+    import replicate
+
+T = TypeVar("T")
+
+
+@lru_cache(maxsize=1)
+def get_replicate_client() -> "replicate.Client":
+    """
+    Return a singleton Replicate client so predictions share one connection pool.
+    Routes only use its async API (`async_run`, `predictions.async_create`): the
+    transport is an HTTP/2 keep-alive pool, so concurrent creates multiplex over
+    a few TLS connections. (replicate passes the same transport to its lazily
+    built sync client, which is therefore not usable with this instance.)
+
+    `replicate` is imported on first call rather than at module import, keeping
+    it off the worker's boot path (Cloud Run cold starts).
+    """
+    import replicate
+
+    return replicate.Client(
+        api_token=settings.REPLICATE_API_TOKEN,
+        transport=httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+        ),
+    )
+
+
+def _replicate_error_status(status: int | None) -> int:
+    """Map a Replicate API status to ours: client errors pass through (429 too),
+    auth and server-side failures are the upstream's fault (502)."""
+    if status is None or status in (401, 403) or status >= 500:
+        return 502
+    return status
+
+
+def replicate_http_error(exc: Exception) -> HTTPException | None:
+    """
+    The HTTP error a Replicate failure maps to: API errors keep their status (see
+    `_replicate_error_status`), a failed model run is a 400, timeouts a 504 and
+    other transport errors a 502. None when `exc` is not a Replicate failure.
+    """
+    if isinstance(exc, HTTPException):
+        return exc
+    if isinstance(exc, httpx.TimeoutException):
+        return HTTPException(status_code=504, detail="Replicate request timed out")
+    if isinstance(exc, httpx.HTTPError):
+        return HTTPException(status_code=502, detail=f"Replicate unreachable: {exc}")
+
+    # Already imported by the time a Replicate call has raised.
+    from replicate.exceptions import ModelError, ReplicateError
+
+    if isinstance(exc, ReplicateError):
+        return HTTPException(
+            status_code=_replicate_error_status(exc.status),
+            detail=exc.detail or str(exc),
+        )
+    if isinstance(exc, ModelError):
+        return HTTPException(status_code=400, detail=str(exc))
+    return None
+
+
+def catch_replicate_errors(
+    endpoint: Callable[..., Awaitable[T]],
+) -> Callable[..., Awaitable[T]]:
+    """
+    Decorate an async route so Replicate failures become meaningful HTTP errors
+    (see `replicate_http_error`). Anything else propagates unchanged. `wraps`
+    keeps the signature FastAPI reads.
+    """
+
+    @wraps(endpoint)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        try:
+            return await endpoint(*args, **kwargs)
+        except HTTPException:
+            raise
+        except Exception as exc:
+            error = replicate_http_error(exc)
+            if error is None:
+                raise
+            raise error from exc
+
+    return wrapper
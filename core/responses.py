@@ -0,0 +1,14 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson.
+    Local equivalent of fastapi.responses.ORJSONResponse, which is deprecated upstream.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
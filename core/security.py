@@ -1,21 +1,151 @@
-from typing import Any, Dict
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
 
-import jwt
-from fastapi import Depends, HTTPException, status
+from cachetools import TTLCache
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
-from core.config import settings
+from core.security_fast import (
+    SECRET_BYTES,
+    ExpiredTokenError,
+    ImmatureTokenError,
+    InvalidTokenError,
+    _verify_hs256,
+)
 
 bearer_scheme = HTTPBearer(auto_error=False)
 
+_JWT_CACHE_TTL_SECONDS = 30
 
-def verify_supabase_jwt(
+# Verified contexts keyed by the SHA-256 digest of the token (never the raw token).
+# Values are (valid_until, AuthContext) so an entry never outlives the token's `exp`.
+_JWT_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=_JWT_CACHE_TTL_SECONDS)
+# Recently rejected tokens (digest -> 401 detail): replayed junk is refused for a
+# fixed window without another HMAC check. Only rejections that cannot change
+# with time are cached (signature, format, aud/iss): an expired token, or one
+# whose nbf/iat is a moment ahead of this server's clock, is re-checked.
+_BAD_TOKENS: TTLCache = TTLCache(maxsize=10_000, ttl=10)
+# Supabase access tokens are ~1 KB; anything far larger is refused before hashing.
+_MAX_TOKEN_LENGTH = 8192
+_JWT_CACHE_LOCK = threading.Lock()
+
+
+@dataclass(slots=True, frozen=True)
+class AuthContext:
+    """Verified Supabase identity: the decoded JWT and the user id derived from it once."""
+
+    user_id: Optional[str]
+    payload: Dict[str, Any]
+
+
+def _extract_user_id(token_payload: Dict[str, Any]) -> Optional[str]:
+    """
+    Pull the Supabase user identifier from the decoded JWT payload.
+    """
+    possible_ids = [
+        token_payload.get("sub"),
+        token_payload.get("user_id"),
+    ]
+    user_claim = token_payload.get("user")
+    if isinstance(user_claim, dict):
+        possible_ids.append(user_claim.get("id"))
+
+    for candidate in possible_ids:
+        if candidate:
+            return str(candidate)
+    return None
+
+
+def _cache_lookup(key: bytes) -> Tuple[Optional[AuthContext], Optional[str]]:
+    """Return (auth_context, rejection_detail) cached for the token digest."""
+    with _JWT_CACHE_LOCK:
+        rejected = _BAD_TOKENS.get(key)
+        if rejected is not None:
+            return None, rejected
+        cached = _JWT_CACHE.get(key)
+
+    if cached is None:
+        return None, None
+    valid_until, auth = cached
+    if valid_until <= time.time():
+        return None, None
+    return auth, None
+
+
+def _cache_store(key: bytes, auth: AuthContext) -> None:
+    now = time.time()
+    valid_until = now + _JWT_CACHE_TTL_SECONDS
+    exp = auth.payload.get("exp")
+    if isinstance(exp, (int, float)):
+        valid_until = min(valid_until, float(exp))
+    if valid_until <= now:
+        return
+    with _JWT_CACHE_LOCK:
+        _JWT_CACHE[key] = (valid_until, auth)
+
+
+def _cache_reject(key: bytes, detail: str) -> None:
+    with _JWT_CACHE_LOCK:
+        _BAD_TOKENS[key] = detail
+
+
+def _decode_token(token: str) -> AuthContext:
+    """Return the verified context for `token`, going through the TTL caches."""
+    cache_key = hashlib.sha256(token.encode()).digest()
+    cached_auth, rejected_detail = _cache_lookup(cache_key)
+    if rejected_detail is not None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=rejected_detail,
+        )
+    if cached_auth is not None:
+        return cached_auth
+
+    try:
+        payload = _verify_hs256(token, SECRET_BYTES)
+    except ExpiredTokenError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token expired",
+        ) from exc
+    except ImmatureTokenError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Invalid token: {exc}",
+        ) from exc
+    except InvalidTokenError as exc:
+        detail = f"Invalid token: {exc}"
+        _cache_reject(cache_key, detail)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=detail,
+        ) from exc
+
+    auth = AuthContext(user_id=_extract_user_id(payload), payload=payload)
+    _cache_store(cache_key, auth)
+    return auth
+
+
+async def verify_supabase_jwt(
+    request: Request,
     credentials: HTTPAuthorizationCredentials | None = Depends(bearer_scheme),
-) -> Dict[str, Any]:
+) -> AuthContext:
     """
     Validate the Supabase JWT contained in the Authorization header.
-    Returns the decoded payload when successful.
+    Returns an `AuthContext` when successful, and stores it on
+    `request.state.auth` so the token is verified at most once per request.
+
+    Declared async so FastAPI keeps it on the event loop: a cache hit is a dict
+    lookup and a miss is a single HMAC (a few microseconds), neither of which
+    is worth a threadpool hop.
     """
+    auth = getattr(request.state, "auth", None)
+    if auth is not None:
+        return auth
+
     if credentials is None or not credentials.credentials:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -28,27 +158,13 @@ def verify_supabase_jwt(
             detail="Invalid authorization scheme",
         )
 
-    token = credentials.credentials
-    audience = settings.SUPABASE_JWT_AUDIENCE.strip()
-    decode_options = {"verify_aud": False} if not audience else None
-
-    try:
-        payload = jwt.decode(
-            token,
-            settings.SUPABASE_JWT_SECRET,
-            algorithms=[settings.SUPABASE_JWT_ALGORITHM],
-            audience=audience if audience else None,
-            options=decode_options,
-        )
-    except jwt.ExpiredSignatureError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token expired",
-        ) from exc
-    except jwt.InvalidTokenError as exc:
+    if len(credentials.credentials) > _MAX_TOKEN_LENGTH:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Invalid token: {exc}",
-        ) from exc
+            detail="Invalid token: too long",
+        )
+
+    auth = _decode_token(credentials.credentials)
+    request.state.auth = auth
+    return auth
 
-    return payload
@@ -0,0 +1,113 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import re
+import time
+from typing import Any, Dict
+
+import orjson
+
+from core.config import settings
+
+# Everything derived from settings is computed once here, not per token.
+ALGORITHM = settings.SUPABASE_JWT_ALGORITHM
+if ALGORITHM != "HS256":
+    raise RuntimeError(f"Unsupported SUPABASE_JWT_ALGORITHM '{ALGORITHM}' (only HS256)")
+
+SECRET_BYTES = settings.SUPABASE_JWT_SECRET.encode()
+AUD = settings.SUPABASE_JWT_AUDIENCE.strip() or None
+ISS = (settings.SUPABASE_JWT_ISSUER or "").strip() or None
+
+# Unpadded base64url, as JWT segments must be. `urlsafe_b64decode` alone silently
+# drops characters outside its alphabet, so junk could be appended to a signature.
+_B64URL_SEGMENT = re.compile(r"[A-Za-z0-9_-]*")
+
+
+class InvalidTokenError(Exception):
+    """Raised when a JWT cannot be decoded or fails validation."""
+
+
+class ExpiredTokenError(InvalidTokenError):
+    """Raised when a JWT is well-formed and signed but its `exp` has passed."""
+
+
+class ImmatureTokenError(InvalidTokenError):
+    """Raised when a JWT is well-formed and signed but its `nbf`/`iat` is still ahead."""
+
+
+def _b64url_decode(segment: str) -> bytes:
+    if not _B64URL_SEGMENT.fullmatch(segment) or len(segment) % 4 == 1:
+        raise InvalidTokenError("Invalid base64url segment")
+    try:
+        return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+    except (binascii.Error, ValueError) as exc:
+        raise InvalidTokenError("Invalid base64 padding") from exc
+
+
+def _load_segment(segment: str, name: str) -> Dict[str, Any]:
+    try:
+        value = orjson.loads(_b64url_decode(segment))
+    except orjson.JSONDecodeError as exc:
+        raise InvalidTokenError(f"Invalid {name} string") from exc
+    if not isinstance(value, dict):
+        raise InvalidTokenError(f"Invalid {name} string: must be a json object")
+    return value
+
+
+def _numeric_claim(payload: Dict[str, Any], claim: str, label: str) -> Any:
+    """Return the `claim` value (None when absent), rejecting non-numeric values."""
+    value = payload.get(claim)
+    if value is not None and (
+        isinstance(value, bool) or not isinstance(value, (int, float))
+    ):
+        raise InvalidTokenError(f"{label} claim ({claim}) must be a number.")
+    return value
+
+
+def _verify_hs256(token: str, secret: bytes) -> Dict[str, Any]:
+    """
+    Verify an HS256 JWT with the stdlib (OpenSSL-backed) HMAC and return its payload.
+    Validates `exp`, `nbf`, `iat`, `aud` (when configured) and `iss` (when configured).
+    """
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+    except ValueError as exc:
+        raise InvalidTokenError("Not enough segments") from exc
+
+    header = _load_segment(header_b64, "header")
+    if header.get("alg") != ALGORITHM:
+        raise InvalidTokenError("The specified alg value is not allowed")
+
+    signing_input = f"{header_b64}.{payload_b64}".encode()
+    expected = hmac.new(secret, signing_input, hashlib.sha256).digest()
+    if not hmac.compare_digest(expected, _b64url_decode(signature_b64)):
+        raise InvalidTokenError("Signature verification failed")
+
+    payload = _load_segment(payload_b64, "payload")
+    now = time.time()
+
+    exp = _numeric_claim(payload, "exp", "Expiration Time")
+    if exp is not None and exp <= now:
+        raise ExpiredTokenError("Signature has expired")
+
+    nbf = _numeric_claim(payload, "nbf", "Not Before")
+    if nbf is not None and nbf > now:
+        raise ImmatureTokenError("The token is not yet valid (nbf)")
+
+    iat = _numeric_claim(payload, "iat", "Issued At")
+    if iat is not None and iat > now:
+        raise ImmatureTokenError("The token is not yet valid (iat)")
+
+    if AUD:
+        aud = payload.get("aud")
+        if aud is None:
+            raise InvalidTokenError('Token is missing the "aud" claim')
+        audiences = [aud] if isinstance(aud, str) else aud
+        if not isinstance(audiences, list) or AUD not in audiences:
+            raise InvalidTokenError("Audience doesn't match")
+
+    if ISS and payload.get("iss") != ISS:
+        raise InvalidTokenError("Invalid issuer")
+
+    return payload
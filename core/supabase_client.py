@@ -1,6 +1,7 @@
 from functools import lru_cache
 
-from supabase import Client, create_client
+import httpx
+from supabase import AsyncClient, AsyncClientOptions, Client, create_client
 
 from core.config import settings
 
@@ -9,3 +10,32 @@ from core.config import settings
 def get_supabase_client() -> Client:
     """Return a singleton Supabase client configured from settings."""
     return create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
+
+
+@lru_cache(maxsize=1)
+def get_async_supabase_client() -> AsyncClient:
+    """
+    Return a singleton async Supabase client for use inside `async def` routes.
+    PostgREST and Storage share one pooled HTTP/2 connection set.
+    """
+    http_client = httpx.AsyncClient(
+        http2=True,
+        follow_redirects=True,
+        timeout=httpx.Timeout(60.0, connect=10.0),
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    )
+    return AsyncClient(
+        settings.SUPABASE_URL,
+        settings.SUPABASE_SERVICE_ROLE_KEY,
+        AsyncClientOptions(httpx_client=http_client),
+    )
+
+
+async def close_async_supabase_client() -> None:
+    """Close the pooled connections of the async client, if it was ever created."""
+    if not get_async_supabase_client.cache_info().currsize:
+        return
+    http_client = get_async_supabase_client().options.httpx_client
+    get_async_supabase_client.cache_clear()
+    if http_client is not None:
+        await http_client.aclose()
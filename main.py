@@ -1,16 +1,44 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+
+from core.config import settings
+from core.http_client import close_http_client
+from core.logging_setup import start_logging, stop_logging
+from core.responses import ORJSONResponse
+from core.supabase_client import close_async_supabase_client
 from routers import auth, replicate_ai, enhancor_crisp
 
-app = FastAPI(title="FastAPI x Replicate")
 
-# Development CORS configuration
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_logging()
+    await replicate_ai.start_webhook_consumer()
+    yield
+    await replicate_ai.stop_webhook_consumer()
+    await close_http_client()
+    await close_async_supabase_client()
+    stop_logging()
+
+
+app = FastAPI(
+    title="FastAPI x Replicate",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
+
+# Explicit allowlist (a wildcard is rejected by browsers with credentials) and a
+# long max_age so preflights are cached instead of repeated.
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=[
+        origin.strip() for origin in settings.FRONTEND_ORIGIN.split(",") if origin.strip()
+    ],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=86400,
 )
 
 # Auth routes
@@ -23,3 +51,20 @@ app.include_router(enhancor_crisp.router, prefix="/ai", tags=["enhancor-crisp"])
 @app.get("/")
 def root():
     return {"ok": True}
+
+
+if __name__ == "__main__":
+    # Local equivalent of the Dockerfile CMD (uvloop loop, httptools HTTP parser).
+    import os
+
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", "8080")),
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.environ.get("WEB_CONCURRENCY", "1")),
+        access_log=False,
+    )
@@ -18,8 +18,11 @@ class LoginRequest(BaseModel):
     password: str
 
 
+# Plain `def`: supabase-py auth is blocking, so FastAPI runs this in its threadpool.
+# It keeps using the sync client so signing a user in never swaps the auth header
+# of the shared async client used by the other routes.
 @router.post("/login")
-async def login(payload: LoginRequest):
+def login(payload: LoginRequest):
     supabase = get_supabase_client()
 
     try:
@@ -1,60 +1,169 @@
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Tuple
-from urllib.parse import urlparse
-import json
+from functools import lru_cache
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple, Union
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import logging
+import time
 
 import httpx
-import os
-import replicate
-from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+import orjson
+from cachetools import TTLCache
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+from pydantic import BaseModel, ConfigDict, Field
 
 from core.config import settings
-from core.security import verify_supabase_jwt
-from core.supabase_client import get_supabase_client
+from core.http_client import get_http_client
+from core.replicate_client import (
+    catch_replicate_errors,
+    get_replicate_client,
+    replicate_http_error,
+)
+from core.responses import ORJSONResponse
+from core.security import AuthContext, verify_supabase_jwt
+from core.supabase_client import get_async_supabase_client
 
 MODEL_ID = "ideogram-ai/ideogram-character"
 
-# Configure the token for the Replicate client
-os.environ["REPLICATE_API_TOKEN"] = settings.REPLICATE_API_TOKEN
-
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Resolved (folder_id, folder_path) keyed by ("id", user_id, folder_id) or
+# ("path", user_id, path).
+# Folders are rarely renamed or moved, so a short TTL bounds staleness.
+_FOLDER_ID_CACHE: TTLCache = TTLCache(maxsize=5000, ttl=60)
+
+_URL_TRIM_CHARS = frozenset(' \t\r\n"')
+
+_TERMINAL_STATUSES = frozenset(("succeeded", "failed", "canceled", "completed"))
+_SUCCESS_STATUSES = frozenset(("succeeded", "completed", "success"))
+
+# Storage upload options shared by every asset; only content-type varies.
+_ASSET_UPLOAD_OPTIONS = {"upsert": "true"}
+
+# Maximum clock skew accepted on webhook-timestamp (replay protection).
+_WEBHOOK_TOLERANCE_SECONDS = 300
+# Replicate webhook bodies are a few KB, plus the echoed `input`; anything beyond
+# this is refused before it is buffered or HMAC'd. Accepted inputs must fit well
+# under it (see `_MAX_REFERENCE_IMAGE_CHARS`), or every webhook for that
+# prediction would be refused for good.
+_MAX_WEBHOOK_BODY_BYTES = 5 * 1024 * 1024
+# Longest `character_reference_image` (URL or data: URI) accepted: leaves 2 MiB
+# of the webhook cap for the rest of the echoed payload (output, logs, ...).
+_MAX_REFERENCE_IMAGE_CHARS = 3 * 1024 * 1024
+
+# Webhook events are acknowledged, queued, and persisted by a consumer task
+# started from the app lifespan (see `start_webhook_consumer`).
+_WEBHOOK_QUEUE_SIZE = 1000
+# Queued events were already acknowledged (Replicate will not resend them), so a
+# transient write failure (network, 5xx, connection/deadlock errors) is retried
+# with capped backoff: ~1 min in all. Meanwhile the queue fills and new webhooks
+# fall back to the inline path, whose 500 makes Replicate retry them itself.
+# Permanent failures (rejected payloads) are not retried.
+_WEBHOOK_WRITE_ATTEMPTS = 8
+_WEBHOOK_RETRY_INITIAL_DELAY_SECONDS = 0.5
+_WEBHOOK_RETRY_MAX_DELAY_SECONDS = 30.0
+# PostgREST codes for a database it cannot reach (PGRST000-003), and SQLSTATE
+# classes for conditions that clear up on their own: connection exception,
+# transaction rollback (deadlock, serialization), insufficient resources,
+# operator intervention, system error.
+_TRANSIENT_POSTGREST_CODES = frozenset(("PGRST000", "PGRST001", "PGRST002", "PGRST003"))
+_TRANSIENT_SQLSTATE_CLASSES = frozenset(("08", "40", "53", "57", "58"))
+# The consumer writes up to this many events per upsert, waiting at most this
+# long after the first one for more to arrive.
+_WEBHOOK_BATCH_SIZE = 128
+_WEBHOOK_BATCH_WINDOW_SECONDS = 0.25
+_WEBHOOK_QUEUE: Optional["asyncio.Queue[Tuple[Dict[str, Any], List[str]]]"] = None
+_WEBHOOK_CONSUMER: Optional["asyncio.Task[None]"] = None
+# Detached asset-storage tasks (strong references until they finish).
+_ASSET_TASKS: Set["asyncio.Task[None]"] = set()
+
+# Batch creation: items per request, and Replicate creates in flight per worker
+# across all batch requests.
+_BATCH_MAX_ITEMS = 50
+_BATCH_CREATE_SEMAPHORE = asyncio.Semaphore(100)
+
+# GET /predictions/{id}?wait=N long-poll: cap on N, and backoff between re-reads.
+_POLL_MAX_WAIT_SECONDS = 30
+_POLL_INITIAL_DELAY_SECONDS = 0.5
+_POLL_MAX_DELAY_SECONDS = 5.0
+
+# Job rows read by GET /predictions/{id}, shared by concurrent pollers of the same
+# id. In-progress rows are only reused briefly; terminal rows no longer change.
+_JOB_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=0.5)
+_TERMINAL_JOB_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+_JOB_INFLIGHT: Dict[str, "asyncio.Task[Optional[Dict[str, Any]]]"] = {}
+
+# run-direct output: one URL, or a list of them for multi-output models.
+OutputUrl = Union[str, List[Any], None]
+
+# run-direct results keyed by a digest of the model input. Replicate delivery
+# URLs expire after an hour, so entries must not outlive them.
+_RUN_DIRECT_CACHE: TTLCache = TTLCache(maxsize=1000, ttl=30 * 60)
+# Single-flight: identical concurrent run-direct calls share one Replicate run.
+_RUN_DIRECT_INFLIGHT: Dict[str, "asyncio.Task[OutputUrl]"] = {}
+
+# Downloads/uploads in flight at once for a single prediction's outputs.
+_ASSET_TRANSFER_CONCURRENCY = 8
+# Downloads are streamed in chunks and abandoned past the size cap.
+_ASSET_CHUNK_SIZE = 64 * 1024
+_MAX_ASSET_BYTES = 64 * 1024 * 1024
 
 
 # ---------- SCHEMAS ----------
+# Values accepted by ideogram-character; anything else is a 422 before Replicate
+# is called. `resolution` stays free-form (a long list of WxH sizes).
+StyleType = Literal["Auto", "Fiction", "Realistic"]
+AspectRatio = Literal[
+    "1:1", "16:9", "9:16", "4:3", "3:4", "3:2", "2:3", "16:10", "10:16",
+    "5:4", "4:5", "2:1", "1:2", "3:1", "1:3",
+]
+RenderingSpeed = Literal["Default", "Turbo", "Quality"]
+MagicPromptOption = Literal["Auto", "On", "Off"]
+WebhookEvent = Literal["start", "output", "logs", "completed"]
+
+
 class IdeogramRunIn(BaseModel):
+    # Unknown client fields are dropped, never forwarded to Replicate.
+    model_config = ConfigDict(extra="ignore")
+
     prompt: str
-    character_reference_image: Optional[str] = None
-    resolution: str = "None"
-    style_type: str = "Auto"
-    aspect_ratio: str = "1:1"
-    rendering_speed: str = "Default"
-    magic_prompt_option: str = "Auto"
+    character_reference_image: Optional[str] = Field(
+        None, max_length=_MAX_REFERENCE_IMAGE_CHARS
+    )
+    # Unset fields are left out of the Replicate input (its own default applies).
+    resolution: Optional[str] = None
+    style_type: StyleType = "Auto"
+    aspect_ratio: AspectRatio = "1:1"
+    rendering_speed: RenderingSpeed = "Default"
+    magic_prompt_option: MagicPromptOption = "Auto"
 
 
 class PredictionCreateIn(IdeogramRunIn):
-    webhook_events: list[str] = ["completed"]
+    webhook_events: list[WebhookEvent] = ["completed"]
     folder_id: Optional[str] = None
     folder_path: Optional[str] = None
 
 
-def _extract_user_id(token_payload: Dict[str, Any]) -> Optional[str]:
+class PredictionBatchIn(BaseModel):
+    items: list[PredictionCreateIn] = Field(min_length=1, max_length=_BATCH_MAX_ITEMS)
+
+
+# Fields forwarded to Replicate as the model input (the rest is API bookkeeping).
+_REPLICATE_INPUT_FIELDS = frozenset(IdeogramRunIn.model_fields)
+
+
+def _replicate_input(payload: IdeogramRunIn) -> Dict[str, Any]:
     """
-    Pull the Supabase user identifier from the decoded JWT payload.
+    Build the Replicate `input` dict in one pydantic-core serialization pass.
+    Fields left as None are omitted rather than sent as nulls.
     """
-    possible_ids = [
-        token_payload.get("sub"),
-        token_payload.get("user_id"),
-    ]
-    user_claim = token_payload.get("user")
-    if isinstance(user_claim, dict):
-        possible_ids.append(user_claim.get("id"))
-
-    for candidate in possible_ids:
-        if candidate:
-            return str(candidate)
-    return None
+    return payload.model_dump(include=_REPLICATE_INPUT_FIELDS, exclude_none=True)
 
 
 def _utc_now_iso() -> str:
@@ -88,7 +197,7 @@ def _response_data(response: Any) -> Optional[List[Dict[str, Any]]]:
     return data
 
 
-def _ensure_folder_path(
+async def _ensure_folder_path(
     supabase: Any, user_id: str, folder_path: str
 ) -> Tuple[str, str]:
     """
@@ -100,31 +209,30 @@ def _ensure_folder_path(
         raise HTTPException(status_code=400, detail="Invalid folder_path value")
 
     segments = normalized.split("/")
-    current_id: Optional[str] = None
-    path_parts: List[str] = []
+    ltree_values = [".".join(segments[: depth + 1]) for depth in range(len(segments))]
 
-    for segment in segments:
-        path_parts.append(segment)
-        ltree_value = ".".join(path_parts)
+    # One round-trip for every ancestor; only the missing tail is inserted below.
+    try:
+        response = await (
+            supabase.table("folders")
+            .select("id, path")
+            .eq("user_id", user_id)
+            .in_("path", ltree_values)
+            .execute()
+        )
+    except Exception as exc:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Unable to check folder path '{normalized}': {exc}",
+        ) from exc
 
-        try:
-            response = (
-                supabase.table("folders")
-                .select("id")
-                .eq("user_id", user_id)
-                .eq("path", ltree_value)
-                .limit(1)
-                .execute()
-            )
-        except Exception as exc:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Unable to check folder path '{normalized}': {exc}",
-            ) from exc
+    existing_ids = {row["path"]: row["id"] for row in _response_data(response) or []}
+    current_id: Optional[str] = None
 
-        data = _response_data(response)
-        if data:
-            current_id = data[0]["id"]
+    for segment, ltree_value in zip(segments, ltree_values):
+        existing_id = existing_ids.get(ltree_value)
+        if existing_id is not None:
+            current_id = existing_id
             continue
 
         insert_payload = {
@@ -134,7 +242,7 @@ def _ensure_folder_path(
             "path": ltree_value,
         }
         try:
-            insert_response = (
+            insert_response = await (
                 supabase.table("folders")
                 .insert(insert_payload)
                 .select("id")
@@ -162,36 +270,51 @@ def _ensure_folder_path(
     return current_id, normalized
 
 
-def _fetch_folder_info(
+async def _fetch_folder_info(
     supabase: Any, folder_id: str, user_id: Optional[str] = None
 ) -> Optional[Dict[str, Any]]:
     try:
         query = supabase.table("folders").select("id, user_id, path, name").eq("id", folder_id)
         if user_id:
             query = query.eq("user_id", user_id)
-        response = query.limit(1).execute()
+        response = await query.limit(1).execute()
     except Exception as exc:  # pragma: no cover
-        print(f"[folders] Unable to fetch folder info for id {folder_id}: {exc}")
+        logger.warning("[folders] Unable to fetch folder info for id %s: %s", folder_id, exc)
         return None
     data = _response_data(response)
     return data[0] if data else None
 
 
-def _resolve_folder_id(
+async def _resolve_folder_id(
     supabase: Any,
     user_id: Optional[str],
     folder_id: Optional[str],
     folder_path: Optional[str],
-) -> Optional[str]:
-    """Validate folder information and return a folder id when possible."""
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Validate folder information and return (folder_id, slash-separated folder_path)
+    when possible, so callers never need a second lookup for the path.
+    """
+    normalized = _normalize_folder_path(folder_path)
     if not user_id:
-        return folder_id
+        return folder_id, None if folder_id else normalized
+
+    if folder_id:
+        cache_key = ("id", user_id, folder_id)
+    elif normalized:
+        cache_key = ("path", user_id, normalized)
+    else:
+        return None, None
+
+    cached = _FOLDER_ID_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
 
     if folder_id:
         try:
-            response = (
+            response = await (
                 supabase.table("folders")
-                .select("id")
+                .select("id, path")
                 .eq("id", folder_id)
                 .eq("user_id", user_id)
                 .limit(1)
@@ -206,46 +329,42 @@ def _resolve_folder_id(
         data = _response_data(response)
         if not data:
             raise HTTPException(status_code=404, detail="Folder not found for this user")
-        return data[0]["id"]
-
-    if folder_path:
-        try:
-            ensured_id, _ = _ensure_folder_path(supabase, user_id, folder_path)
-            return ensured_id
-        except HTTPException:
-            raise
-        except Exception as exc:  # pragma: no cover
-            print(f"[replicate] Unable to ensure folder_path '{folder_path}': {exc}")
-            return None
+        resolved = (data[0]["id"], _ltree_to_path(data[0].get("path")))
+        _FOLDER_ID_CACHE[cache_key] = resolved
+        return resolved
 
-    return None
+    try:
+        ensured_id, _ = await _ensure_folder_path(supabase, user_id, normalized)
+    except HTTPException:
+        raise
+    except Exception as exc:  # pragma: no cover
+        logger.warning("[replicate] Unable to ensure folder_path '%s': %s", folder_path, exc)
+        return None, normalized
+    resolved = (ensured_id, normalized)
+    _FOLDER_ID_CACHE[cache_key] = resolved
+    return resolved
 
 
 def _extract_output_urls(output: Any) -> List[str]:
     """Extract HTTP URLs from arbitrary Replicate output structures."""
-    urls: List[str] = []
-
-    def _walk(value: Any) -> None:
+    # Insertion-ordered dict doubles as the dedupe set, so no second pass is needed.
+    urls: Dict[str, None] = {}
+    # Iterative depth-first walk; children are pushed reversed to keep output order.
+    stack: List[Any] = [output]
+    while stack:
+        value = stack.pop()
         if isinstance(value, str):
-            candidate = value.strip().strip('"')
-            if candidate.startswith("http"):
-                urls.append(candidate)
+            # Only pay for strip() when the raw string is not already a clean URL.
+            if not value.startswith("http") or value[-1] in _URL_TRIM_CHARS:
+                value = value.strip().strip('"')
+            if value.startswith("http"):
+                urls[value] = None
         elif isinstance(value, list):
-            for item in value:
-                _walk(item)
+            stack.extend(reversed(value))
         elif isinstance(value, dict):
-            for item in value.values():
-                _walk(item)
+            stack.extend(reversed(value.values()))
 
-    _walk(output)
-    # Deduplicate while keeping order
-    seen = set()
-    deduped: List[str] = []
-    for url in urls:
-        if url not in seen:
-            deduped.append(url)
-            seen.add(url)
-    return deduped
+    return list(urls)
 
 
 def _build_asset_fileinfo(
@@ -256,11 +375,22 @@ def _build_asset_fileinfo(
     folder_path: Optional[str] = None,
 ) -> Dict[str, str]:
     """Return filename and storage path within the assets bucket."""
-    parsed = urlparse(url)
-    base = parsed.path.rsplit("/", 1)[-1] if parsed.path else ""
-    name, ext = os.path.splitext(base)
-    if not ext:
-        ext = ".png"
+    # Extension of the last path segment, found with index scans only (no URL
+    # parse): cut the query/fragment, skip `scheme://host`, so a host-only URL
+    # (`https://cdn.x.com`) has no path, hence no extension.
+    end = len(url)
+    for marker in "?#":
+        cut = url.find(marker, 0, end)
+        if cut >= 0:
+            end = cut
+    scheme = url.find("://", 0, end)
+    path_start = url.find("/", scheme + 3 if scheme >= 0 else 0, end)
+    ext = ".png"
+    if path_start >= 0:
+        slash = url.rfind("/", path_start, end)
+        dot = url.rfind(".", slash + 1, end)
+        if dot > slash + 1:
+            ext = url[dot:end]
     filename = f"{prediction_id}_{index}{ext}"
 
     segments: List[str] = [user_id]
@@ -284,15 +414,16 @@ async def _store_assets_for_prediction(
 
     user_id = job.get("user_id")
     if not user_id:
-        print(
-            f"[replicate_webhook] Missing user_id on job {job.get('id')} – skipping asset storage"
+        logger.warning(
+            "[replicate_webhook] Missing user_id on job %s – skipping asset storage",
+            job.get("id"),
         )
         return
 
     metadata = job.get("metadata") or {}
     if isinstance(metadata, str):
         try:
-            metadata = json.loads(metadata)
+            metadata = orjson.loads(metadata)
         except Exception:  # pragma: no cover
             metadata = {}
     folder_id = metadata.get("resolved_folder_id") or metadata.get("folder_id")
@@ -300,52 +431,49 @@ async def _store_assets_for_prediction(
     source_task_id = metadata.get("task_id") or job.get("task_id")
 
     if folder_id and not folder_path:
-        folder_info = _fetch_folder_info(supabase, folder_id, user_id)
+        folder_info = await _fetch_folder_info(supabase, folder_id, user_id)
         folder_path = _ltree_to_path(folder_info.get("path") if folder_info else None)  # type: ignore[union-attr]
 
     if not folder_id and folder_path:
-        folder_id = _resolve_folder_id(
-            supabase, user_id, None, _normalize_folder_path(folder_path)
-        )
+        try:
+            folder_id, _ = await _resolve_folder_id(supabase, user_id, None, folder_path)
+        except Exception as exc:
+            # Still store the files (under the same path), just without the folder link.
+            logger.warning(
+                "[replicate_webhook] Folder resolution failed for prediction %s (%s): %s; "
+                "storing assets without folder_id",
+                prediction_id,
+                folder_path,
+                getattr(exc, "detail", exc),
+            )
     if folder_id:
         folder_id = str(folder_id)
 
-    try:
-        existing_resp = (
-            supabase.table("assets")
-            .select("id, metadata")
-            .eq("source_task_id", job["id"])
-            .execute()
-        )
-    except Exception as exc:  # pragma: no cover
-        print(
-            f"[replicate_webhook] Unable to read existing assets for prediction {prediction_id}: {exc}"
-        )
-        existing_resp = None
-
-    existing_data = _response_data(existing_resp) or []
-    existing_urls = {
-        (item.get("metadata") or {}).get("external_url") for item in existing_data
-    }
+    semaphore = asyncio.Semaphore(_ASSET_TRANSFER_CONCURRENCY)
 
-    new_records: List[Dict[str, Any]] = []
-    async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as client:
-        for index, url in enumerate(urls):
-            cleaned_url = url.strip()
-            if not cleaned_url or cleaned_url in existing_urls:
-                continue
+    client = get_http_client()
 
+    async def _process(index: int, cleaned_url: str) -> Optional[Dict[str, Any]]:
+        async with semaphore:
             try:
-                response = await client.get(cleaned_url)
-                response.raise_for_status()
+                async with client.stream("GET", cleaned_url) as response:
+                    response.raise_for_status()
+                    content_type = response.headers.get("content-type", "image/png")
+                    chunks: List[bytes] = []
+                    received = 0
+                    async for chunk in response.aiter_bytes(_ASSET_CHUNK_SIZE):
+                        received += len(chunk)
+                        if received > _MAX_ASSET_BYTES:
+                            raise ValueError(f"asset exceeds {_MAX_ASSET_BYTES} bytes")
+                        chunks.append(chunk)
             except Exception as exc:
-                print(
-                    f"[replicate_webhook] Failed to download asset {cleaned_url}: {exc}"
+                logger.warning(
+                    "[replicate_webhook] Failed to download asset %s: %s", cleaned_url, exc
                 )
-                continue
+                return None
 
-            content_type = response.headers.get("content-type", "image/png")
-            content_bytes = response.content
+            # Storage only accepts `bytes`; a single join is the only copy made.
+            content_bytes = b"".join(chunks)
             fileinfo = _build_asset_fileinfo(
                 prediction_id,
                 index,
@@ -357,93 +485,280 @@ async def _store_assets_for_prediction(
 
             try:
                 upload_options = {
+                    **_ASSET_UPLOAD_OPTIONS,
                     "content-type": content_type or "image/png",
-                    "upsert": "true",
                 }
-                supabase.storage.from_("assets").upload(
+                await supabase.storage.from_("assets").upload(
                     storage_path,
                     content_bytes,
                     upload_options,
                 )
             except Exception as exc:
-                print(
-                    f"[replicate_webhook] Failed to upload asset {storage_path} to bucket: {exc}"
+                logger.warning(
+                    "[replicate_webhook] Failed to upload asset %s to bucket: %s",
+                    storage_path,
+                    exc,
                 )
-                continue
+                return None
+
+        asset_metadata = {
+            "source": "replicate",
+            "prediction_id": prediction_id,
+            "external_url": cleaned_url,
+            "folder_path": folder_path,
+        }
+        record: Dict[str, Any] = {
+            "user_id": user_id,
+            "bucket": "assets",
+            "type": "image",
+            "path": storage_path,
+            "filename": fileinfo["filename"],
+            "status": "ready",
+            "mime_type": content_type,
+            "size_bytes": len(content_bytes),
+            "metadata": asset_metadata,
+        }
+        if folder_id:
+            record["folder_id"] = folder_id
+        if source_task_id:
+            record["source_task_id"] = source_task_id
+        return record
+
+    # `index` stays the position in `urls` so filenames are stable across retries.
+    results = await asyncio.gather(
+        *(_process(index, url.strip()) for index, url in enumerate(urls) if url.strip()),
+        return_exceptions=True,
+    )
 
-            asset_metadata = {
-                "source": "replicate",
-                "prediction_id": prediction_id,
-                "external_url": cleaned_url,
-                "folder_path": folder_path,
-            }
-            record: Dict[str, Any] = {
-                "user_id": user_id,
-                "bucket": "assets",
-                "type": "image",
-                "path": storage_path,
-                "filename": fileinfo["filename"],
-                "status": "ready",
-                "mime_type": content_type,
-                "size_bytes": len(content_bytes),
-                "metadata": asset_metadata,
-            }
-            if folder_id:
-                record["folder_id"] = folder_id
-            if source_task_id:
-                record["source_task_id"] = source_task_id
-            new_records.append(record)
+    new_records: List[Dict[str, Any]] = []
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.warning(
+                "[replicate_webhook] Asset transfer failed for %s: %s", prediction_id, result
+            )
+        elif result is not None:
+            new_records.append(result)
 
     if not new_records:
         return
 
+    # ON CONFLICT (bucket, path) DO NOTHING: a re-delivered webhook re-uploads to
+    # the same storage keys, so rows it already created are left untouched (no
+    # pre-select, no row rewrite). Nothing is read back, so PostgREST is told not
+    # to echo the rows (and their metadata JSON).
     try:
-        supabase.table("assets").insert(new_records).execute()
-        print(
-            f"[replicate_webhook] Inserted {len(new_records)} asset(s) for prediction {prediction_id}"
+        await (
+            supabase.table("assets")
+            .upsert(
+                new_records,
+                on_conflict="bucket,path",
+                ignore_duplicates=True,
+                returning=ReturnMethod.minimal,
+            )
+            .execute()
+        )
+        logger.info(
+            "[replicate_webhook] Stored %d asset(s) for prediction %s",
+            len(new_records),
+            prediction_id,
         )
     except Exception as exc:  # pragma: no cover
-        print(
-            f"[replicate_webhook] Failed to insert assets for prediction {prediction_id}: {exc}"
+        logger.error(
+            "[replicate_webhook] Failed to insert %d asset row(s) for prediction %s "
+            "(files are uploaded): %s",
+            len(new_records),
+            prediction_id,
+            exc,
         )
 
 
-# ---------- 1) Direct call (synchronous) ----------
-@router.post("/ideogram/run-direct")
-async def run_ideogram_direct(
-    payload: IdeogramRunIn,
-    token_payload: Dict[str, Any] = Depends(verify_supabase_jwt),
-):
-    # Token payload is only used to ensure the caller is authenticated.
-    _ = token_payload
+def _spawn_asset_storage(
+    supabase: Any,
+    job: Dict[str, Any],
+    prediction_id: str,
+    urls: List[str],
+) -> None:
+    """
+    Run `_store_assets_for_prediction` as a detached task so webhook processing
+    never waits on downloads/uploads. Tasks are tracked (strong reference, and
+    awaited on shutdown by `stop_webhook_consumer`).
+    """
+    task = asyncio.create_task(
+        _store_assets_for_prediction(supabase, job, prediction_id, urls)
+    )
+    _ASSET_TASKS.add(task)
+    task.add_done_callback(lambda done: _finish_asset_storage(prediction_id, done))
+
+
+def _finish_asset_storage(prediction_id: str, task: "asyncio.Task[None]") -> None:
+    _ASSET_TASKS.discard(task)
+    # Nobody awaits the task: surface its failure here rather than as asyncio's
+    # "Task exception was never retrieved".
+    if task.cancelled():
+        logger.warning(
+            "[replicate_webhook] Asset storage cancelled for prediction %s", prediction_id
+        )
+        return
+    exc = task.exception()
+    if exc is not None:
+        logger.error(
+            "[replicate_webhook] Asset storage failed for prediction %s: %s",
+            prediction_id,
+            exc,
+            exc_info=exc,
+        )
+
+
+# Columns `_insert_job` may set on a row the webhook already wrote: attribution
+# only, never the state (`status`, `output`, timestamps) the webhook owns.
+_JOB_ATTRIBUTION_FIELDS = ("user_id", "prompt", "metadata")
+
+
+async def _insert_job(job_record: Dict[str, Any]) -> None:
+    """
+    Persist a freshly created prediction in `replicate_jobs` (run as a background task).
+    Inserts with ON CONFLICT DO NOTHING; if the webhook got there first, only the
+    attribution fields are patched onto its row, and asset storage (skipped by the
+    webhook for lack of a user_id) is triggered again for a succeeded prediction.
+    """
+    supabase = get_async_supabase_client()
+    prediction_id = job_record.get("prediction_id")
     try:
-        output = replicate.run(
-            MODEL_ID,
-            input={
-                "prompt": payload.prompt,
-                "resolution": payload.resolution,
-                "style_type": payload.style_type,
-                "aspect_ratio": payload.aspect_ratio,
-                "rendering_speed": payload.rendering_speed,
-                "magic_prompt_option": payload.magic_prompt_option,
-                "character_reference_image": payload.character_reference_image,
-            },
+        response = await (
+            supabase.table("replicate_jobs")
+            .upsert(job_record, on_conflict="prediction_id", ignore_duplicates=True)
+            .select("id")
+            .execute()
         )
-        output_url = getattr(output, "url", None)
-        if callable(output_url):
-            output_url = output_url()
-        elif output_url is None and isinstance(output, str):
-            output_url = output
-        return {"status": "succeeded", "output_url": output_url}
-    except Exception as exc:  # pragma: no cover - replicate errors bubble up
-        raise HTTPException(status_code=400, detail=str(exc)) from exc
+        if _response_data(response):
+            return
+
+        attribution = {
+            field: job_record[field]
+            for field in _JOB_ATTRIBUTION_FIELDS
+            if job_record.get(field) is not None
+        }
+        if not attribution:
+            return
+        response = await (
+            supabase.table("replicate_jobs")
+            .update(attribution)
+            .eq("prediction_id", prediction_id)
+            .execute()
+        )
+    except Exception as exc:  # pragma: no cover - Supabase connectivity
+        logger.warning(
+            "[replicate] Failed to persist replicate job %s: %s",
+            prediction_id,
+            exc,
+        )
+        return
+
+    _JOB_CACHE.pop(prediction_id, None)
+    _TERMINAL_JOB_CACHE.pop(prediction_id, None)
+    for row in _response_data(response) or []:
+        urls = _extract_output_urls(row.get("output"))
+        if urls and (row.get("status") or "").lower() in _SUCCESS_STATUSES:
+            _spawn_asset_storage(supabase, row, prediction_id, urls)
+
+
+def _ideogram_job_record(
+    payload: PredictionCreateIn,
+    prediction: Any,
+    user_id: Optional[str],
+    folder_id: Optional[str],
+    folder_path: Optional[str],
+) -> Dict[str, Any]:
+    """Build the `replicate_jobs` row for a freshly created Ideogram prediction."""
+    job_record: Dict[str, Any] = {
+        "prediction_id": prediction.id,
+        "model": MODEL_ID,
+        "prompt": payload.prompt,
+        "status": prediction.status,
+        "metadata": {
+            **payload.model_dump(exclude={"prompt"}, exclude_none=True),
+            "folder_path": folder_path,
+            **({"resolved_folder_id": folder_id} if folder_id else {}),
+        },
+        "updated_at": _utc_now_iso(),
+    }
+    if user_id:
+        job_record["user_id"] = user_id
+    return job_record
+
+
+def _as_url(output: Any) -> OutputUrl:
+    """
+    Return the URL(s) of a `replicate.run` output: plain strings as is, FileOutput
+    objects via `.url`, and lists (multi-output models) element-wise.
+    """
+    if isinstance(output, str):
+        return output
+    if isinstance(output, list):
+        return [_as_url(item) for item in output]
+    url = getattr(output, "url", None)
+    return url() if callable(url) else url
+
+
+async def _run_direct(model_input: Dict[str, Any]) -> OutputUrl:
+    # Native async client call: the event loop keeps serving other
+    # requests while the model runs, without tying up a worker thread.
+    output = await get_replicate_client().async_run(MODEL_ID, input=model_input)
+    return _as_url(output)
+
+
+def _finish_run_direct(key: str, task: "asyncio.Task[OutputUrl]") -> None:
+    _RUN_DIRECT_INFLIGHT.pop(key, None)
+    # Reading the exception also marks it retrieved when every caller went away.
+    if task.cancelled() or task.exception() is not None:
+        return
+    output_url = task.result()
+    if output_url:
+        _RUN_DIRECT_CACHE[key] = output_url
+
+
+async def _run_direct_cached(model_input: Dict[str, Any]) -> OutputUrl:
+    """
+    Memoized `_run_direct`: identical inputs reuse a recent output URL, and
+    concurrent identical calls await the same in-flight run.
+    """
+    reference = model_input.get("character_reference_image")
+    if reference is not None and not reference.startswith(("http://", "https://")):
+        # Inline data (data: URIs, ...) is not worth keying on; run it as is.
+        return await _run_direct(model_input)
+
+    key = hashlib.blake2b(
+        orjson.dumps(model_input, option=orjson.OPT_SORT_KEYS), digest_size=16
+    ).hexdigest()
+    cached = _RUN_DIRECT_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    task = _RUN_DIRECT_INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.create_task(_run_direct(model_input))
+        _RUN_DIRECT_INFLIGHT[key] = task
+        task.add_done_callback(lambda done: _finish_run_direct(key, done))
+    # Shielded so one caller disconnecting does not cancel the run for the others.
+    return await asyncio.shield(task)
+
+
+# ---------- 1) Direct call (synchronous) ----------
+@router.post("/ideogram/run-direct", dependencies=[Depends(verify_supabase_jwt)])
+@catch_replicate_errors
+async def run_ideogram_direct(payload: IdeogramRunIn):
+    output_url = await _run_direct_cached(_replicate_input(payload))
+    return {"status": "succeeded", "output_url": output_url}
 
 
 # ---------- 2) Prediction creation + webhook ----------
 @router.post("/ideogram/predictions")
+@catch_replicate_errors
 async def create_prediction(
     payload: PredictionCreateIn,
-    token_payload: Dict[str, Any] = Depends(verify_supabase_jwt),
+    request: Request,
+    background: BackgroundTasks,
+    auth: AuthContext = Depends(verify_supabase_jwt),
 ):
     if payload.folder_id and payload.folder_path:
         raise HTTPException(
@@ -451,116 +766,559 @@ async def create_prediction(
             detail="Provide either folder_id or folder_path, not both.",
         )
 
-    if not settings.WEBHOOK_BASE_URL:
+    if not settings.WEBHOOK_URL:
         raise HTTPException(
             status_code=500,
             detail="WEBHOOK_BASE_URL is not configured",
         )
 
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     normalized_folder_path = _normalize_folder_path(payload.folder_path)
-    try:
-        prediction = replicate.predictions.create(
-            model=MODEL_ID,
-            input={
-                "prompt": payload.prompt,
-                "resolution": payload.resolution,
-                "style_type": payload.style_type,
-                "aspect_ratio": payload.aspect_ratio,
-                "rendering_speed": payload.rendering_speed,
-                "magic_prompt_option": payload.magic_prompt_option,
-                "character_reference_image": payload.character_reference_image,
-            },
-            webhook=f"{settings.WEBHOOK_BASE_URL}/ai/webhooks/replicate",
-            webhook_events_filter=payload.webhook_events,
-        )
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    prediction = await get_replicate_client().predictions.async_create(
+        model=MODEL_ID,
+        input=_replicate_input(payload),
+        webhook=settings.WEBHOOK_URL,
+        webhook_events_filter=payload.webhook_events,
+    )
 
-    user_id = _extract_user_id(token_payload)
+    user_id = auth.user_id
 
     resolved_folder_id: Optional[str] = None
     resolved_folder_path: Optional[str] = normalized_folder_path
     if user_id:
-        resolved_folder_id = _resolve_folder_id(
+        resolved_folder_id, resolved_folder_path = await _resolve_folder_id(
             supabase,
             user_id,
             payload.folder_id,
             normalized_folder_path,
         )
-        if resolved_folder_id and not resolved_folder_path:
-            folder_info = _fetch_folder_info(supabase, resolved_folder_id, user_id)
-            resolved_folder_path = _ltree_to_path(
-                folder_info.get("path") if folder_info else None  # type: ignore[union-attr]
-            )
 
-    job_record: Dict[str, Any] = {
-        "prediction_id": prediction.id,
-        "model": MODEL_ID,
-        "prompt": payload.prompt,
-        "status": prediction.status,
-        "metadata": {
-            **payload.model_dump(exclude={"prompt"}, exclude_none=True),
-            "folder_path": resolved_folder_path,
-            **({"resolved_folder_id": resolved_folder_id} if resolved_folder_id else {}),
+    job_record = _ideogram_job_record(
+        payload, prediction, user_id, resolved_folder_id, resolved_folder_path
+    )
+
+    # Bookkeeping write runs after the response is sent; the webhook upsert
+    # recreates the row if this ever fails.
+    background.add_task(_insert_job, job_record)
+
+    # Asynchronous job creation: 202 pointing at the polling route (which
+    # supports `?wait=` long-polling), with a hint for the first poll.
+    return ORJSONResponse(
+        {"prediction_id": prediction.id, "status": prediction.status},
+        status_code=202,
+        headers={
+            "Location": request.app.url_path_for(
+                "get_prediction", prediction_id=prediction.id
+            ),
+            "Retry-After": "2",
         },
-        "updated_at": _utc_now_iso(),
-    }
-    if user_id:
-        job_record["user_id"] = user_id
+    )
+
+
+# ---------- 2b) Batch prediction creation ----------
+@router.post("/ideogram/predictions:batch")
+async def create_predictions_batch(
+    payload: PredictionBatchIn,
+    background: BackgroundTasks,
+    auth: AuthContext = Depends(verify_supabase_jwt),
+):
+    """
+    Create several Ideogram predictions concurrently. Returns one entry per item,
+    in order: {prediction_id, status}, or {error, status} with the HTTP status and
+    detail the single-create endpoint would have answered when that item failed.
+    """
+    for index, item in enumerate(payload.items):
+        if item.folder_id and item.folder_path:
+            raise HTTPException(
+                status_code=400,
+                detail=f"items[{index}]: Provide either folder_id or folder_path, not both.",
+            )
+
+    if not settings.WEBHOOK_URL:
+        raise HTTPException(
+            status_code=500,
+            detail="WEBHOOK_BASE_URL is not configured",
+        )
+
+    supabase = get_async_supabase_client()
+    user_id = auth.user_id
+
+    # Folders first, once per distinct target and sequentially, so concurrent
+    # items never race to create the same path (and a bad folder fails the
+    # batch before anything is submitted to Replicate).
+    folder_keys = [
+        (item.folder_id, _normalize_folder_path(item.folder_path)) for item in payload.items
+    ]
+    folders: Dict[Tuple[Optional[str], Optional[str]], Tuple[Optional[str], Optional[str]]] = {}
+    for key in folder_keys:
+        if key not in folders:
+            folders[key] = await _resolve_folder_id(supabase, user_id, *key)
+
+    replicate_client = get_replicate_client()
+
+    async def _create(item: PredictionCreateIn) -> Any:
+        # Errors are returned, not raised, so one failure does not cancel the group.
+        async with _BATCH_CREATE_SEMAPHORE:
+            try:
+                return await replicate_client.predictions.async_create(
+                    model=MODEL_ID,
+                    input=_replicate_input(item),
+                    webhook=settings.WEBHOOK_URL,
+                    webhook_events_filter=item.webhook_events,
+                )
+            except Exception as exc:
+                return exc
+
+    async with asyncio.TaskGroup() as group:
+        tasks = [group.create_task(_create(item)) for item in payload.items]
+
+    results: List[Dict[str, Any]] = []
+    for item, key, task in zip(payload.items, folder_keys, tasks):
+        prediction = task.result()
+        if isinstance(prediction, Exception):
+            error = replicate_http_error(prediction)
+            if error is None:
+                # Unexpected: keep it (and its traceback) out of the response.
+                logger.error(
+                    "[ideogram_batch] Prediction create failed",
+                    exc_info=prediction,
+                )
+                error = HTTPException(status_code=500, detail="Prediction creation failed")
+            results.append({"error": error.detail, "status": error.status_code})
+            continue
+        folder_id, folder_path = folders[key]
+        background.add_task(
+            _insert_job,
+            _ideogram_job_record(item, prediction, user_id, folder_id, folder_path),
+        )
+        results.append({"prediction_id": prediction.id, "status": prediction.status})
+
+    return results
 
+
+# ---------- 3) Poll a prediction (reads from Supabase) ----------
+async def _fetch_job(supabase: Any, prediction_id: str) -> Optional[Dict[str, Any]]:
     try:
-        supabase.table("replicate_jobs").insert(job_record).execute()
+        response = await (
+            supabase.table("replicate_jobs")
+            .select("*")
+            .eq("prediction_id", prediction_id)
+            .maybe_single()
+            .execute()
+        )
     except Exception as exc:
         raise HTTPException(
             status_code=502,
-            detail=f"Failed to persist replicate job: {exc}",
+            detail=f"Failed to fetch prediction state: {exc}",
         ) from exc
 
-    return {
-        "prediction_id": prediction.id,
-        "status": prediction.status,
-    }
+    # maybe_single() yields no response at all when the row does not exist.
+    return _response_data(response) or None
+
+
+def _finish_job_fetch(prediction_id: str, task: "asyncio.Task[Optional[Dict[str, Any]]]") -> None:
+    _JOB_INFLIGHT.pop(prediction_id, None)
+    if task.cancelled() or task.exception() is not None:
+        return
+    record = task.result()
+    if record is None:
+        return
+    if str(record.get("status") or "").lower() in _TERMINAL_STATUSES:
+        _TERMINAL_JOB_CACHE[prediction_id] = record
+    else:
+        _JOB_CACHE[prediction_id] = record
+
+
+async def _fetch_job_coalesced(supabase: Any, prediction_id: str) -> Optional[Dict[str, Any]]:
+    """
+    `_fetch_job` with request coalescing: concurrent reads of one id share a
+    single Supabase query, and its result is reused for a short TTL.
+    Authorization stays with the caller (the row is shared across users).
+    """
+    record = _TERMINAL_JOB_CACHE.get(prediction_id) or _JOB_CACHE.get(prediction_id)
+    if record is not None:
+        return record
+
+    task = _JOB_INFLIGHT.get(prediction_id)
+    if task is None:
+        task = asyncio.create_task(_fetch_job(supabase, prediction_id))
+        _JOB_INFLIGHT[prediction_id] = task
+        task.add_done_callback(lambda done: _finish_job_fetch(prediction_id, done))
+    return await asyncio.shield(task)
 
 
-# ---------- 3) Poll a prediction (reads from Supabase) ----------
 @router.get("/predictions/{prediction_id}")
 async def get_prediction(
     prediction_id: str,
-    token_payload: Dict[str, Any] = Depends(verify_supabase_jwt),
+    wait: int = Query(
+        0,
+        ge=0,
+        le=_POLL_MAX_WAIT_SECONDS,
+        description="Long-poll: block up to this many seconds until the prediction is terminal.",
+    ),
+    auth: AuthContext = Depends(verify_supabase_jwt),
 ):
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
+    deadline = time.monotonic() + wait
+    delay = _POLL_INITIAL_DELAY_SECONDS
+
+    # The webhook writes the state into Supabase, so waiting means re-reading the
+    # row with backoff. A row not written yet (job insert still in the background)
+    # is waited for too.
+    while True:
+        record = await _fetch_job_coalesced(supabase, prediction_id)
+        if record is not None:
+            record_user_id = record.get("user_id")
+            if record_user_id and auth.user_id and str(record_user_id) != str(auth.user_id):
+                raise HTTPException(status_code=403, detail="Not authorized")
+            if str(record.get("status") or "").lower() in _TERMINAL_STATUSES:
+                return record
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 2, _POLL_MAX_DELAY_SECONDS)
+
+    if record is None:
+        raise HTTPException(status_code=404, detail="Prediction not found")
+    return record
+
+
+# ---------- Webhook receiver ----------
+@lru_cache(maxsize=4)
+def _webhook_signing_key(secret: str) -> bytes:
+    """Decode the `whsec_<base64>` secret once instead of on every webhook."""
+    return base64.b64decode(secret.split("_", 1)[1] if secret.startswith("whsec_") else secret)
+
+
+def _verify_webhook_signature(request: Request, body: bytes) -> None:
+    """
+    Check Replicate's webhook signature (webhook-id / webhook-timestamp /
+    webhook-signature headers) against REPLICATE_WEBHOOK_SECRET.
+    No-op when no secret is configured.
+    """
+    secret = settings.REPLICATE_WEBHOOK_SECRET
+    if not secret:
+        return
+
+    webhook_id = request.headers.get("webhook-id")
+    timestamp = request.headers.get("webhook-timestamp")
+    signatures = request.headers.get("webhook-signature")
+    if not webhook_id or not timestamp or not signatures:
+        raise HTTPException(status_code=401, detail="Missing webhook signature headers")
+
     try:
-        response = (
+        sent_at = int(timestamp)
+    except ValueError as exc:
+        raise HTTPException(status_code=401, detail="Invalid webhook timestamp") from exc
+    if abs(time.time() - sent_at) > _WEBHOOK_TOLERANCE_SECONDS:
+        raise HTTPException(status_code=401, detail="Webhook timestamp outside tolerance")
+
+    # HMAC over the raw bytes: the id/timestamp prefix, then the body as received
+    # (no decode / re-encode of a potentially large payload).
+    mac = hmac.new(
+        _webhook_signing_key(secret), f"{webhook_id}.{timestamp}.".encode(), hashlib.sha256
+    )
+    mac.update(body)
+    expected = mac.digest()
+
+    # Space-separated `v1,<base64>` entries (several during secret rotation); other
+    # versions are ignored, and strict decoding rejects appended junk.
+    for candidate in signatures.split():
+        version, _, encoded = candidate.partition(",")
+        if version != "v1":
+            continue
+        try:
+            received = base64.b64decode(encoded, validate=True)
+        except (binascii.Error, ValueError):
+            continue
+        if hmac.compare_digest(expected, received):
+            return
+    raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+
+# Webhook columns kept out of updates: the job created by create_prediction (or
+# another router) already records the model it ran, which the payload's
+# `model`/`version` must not replace.
+_WEBHOOK_INSERT_ONLY_FIELDS = ("model",)
+
+
+async def _process_webhook_events(events: List[Tuple[Dict[str, Any], List[str]]]) -> int:
+    """
+    Persist webhook events (one per prediction, identical column sets) in two bulk
+    writes and schedule asset storage for successful outputs.
+    Returns the number of job rows written; raises HTTPException(500) on failure.
+    """
+    # First create the rows the webhook beat create_prediction to, with every
+    # column, leaving existing ones alone. Every row then exists, so the upsert
+    # below only updates: it omits the insert-only columns and returns what
+    # asset storage needs.
+    supabase = get_async_supabase_client()
+    updates = [
+        {
+            field: value
+            for field, value in update_payload.items()
+            if field not in _WEBHOOK_INSERT_ONLY_FIELDS
+        }
+        for update_payload, _ in events
+    ]
+    try:
+        await (
             supabase.table("replicate_jobs")
-            .select("*")
-            .eq("prediction_id", prediction_id)
-            .limit(1)
+            .upsert(
+                [update_payload for update_payload, _ in events],
+                on_conflict="prediction_id",
+                ignore_duplicates=True,
+                returning=ReturnMethod.minimal,
+            )
+            .execute()
+        )
+        response = await (
+            supabase.table("replicate_jobs")
+            .upsert(updates, on_conflict="prediction_id")
+            .select("id, prediction_id, user_id, prompt, metadata")
             .execute()
         )
     except Exception as exc:
+        logger.error(
+            "[replicate_webhook] Failed to upsert %d prediction(s) (%s): %s",
+            len(events),
+            ", ".join(update_payload["prediction_id"] for update_payload, _ in events),
+            exc,
+        )
         raise HTTPException(
-            status_code=502,
-            detail=f"Failed to fetch prediction state: {exc}",
+            status_code=500,
+            detail=f"Failed to persist replicate job: {exc}",
         ) from exc
 
-    data = _response_data(response)
-    if not data:
-        raise HTTPException(status_code=404, detail="Prediction not found")
+    job_records = {row["prediction_id"]: row for row in _response_data(response) or []}
 
-    record = data[0]
-    user_id = _extract_user_id(token_payload)
-    record_user_id = record.get("user_id")
-    if record_user_id and user_id and str(record_user_id) != str(user_id):
-        raise HTTPException(status_code=403, detail="Not authorized")
+    for update_payload, urls in events:
+        prediction_id = update_payload["prediction_id"]
+        normalized_status = update_payload["status"]
+        job_record = job_records.get(prediction_id)
 
-    return record
+        # Pollers on this worker must see the new state right away.
+        _JOB_CACHE.pop(prediction_id, None)
+        _TERMINAL_JOB_CACHE.pop(prediction_id, None)
+
+        if job_record and urls and normalized_status in _SUCCESS_STATUSES:
+            _spawn_asset_storage(supabase, job_record, prediction_id, urls)
+        elif not job_record:
+            logger.warning(
+                "[replicate_webhook] Unable to load job record for prediction %s; "
+                "skipping asset persistence.",
+                prediction_id,
+            )
+
+        logger.info(
+            "[replicate_webhook] Updated prediction %s status=%s job_updated=%s",
+            prediction_id,
+            normalized_status,
+            job_record is not None,
+        )
+    return len(job_records)
+
+
+def _is_transient_write_error(exc: BaseException) -> bool:
+    """
+    Whether a failed `replicate_jobs` write is worth retrying: transport errors
+    and server-side/connection failures are; a payload PostgREST or Postgres
+    rejected (constraint, bad column, ...) would fail the same way every time.
+    """
+    if isinstance(exc, HTTPException) and exc.__cause__ is not None:
+        exc = exc.__cause__
+    if isinstance(exc, httpx.TransportError):
+        return True
+    if not isinstance(exc, APIError):
+        return False
+    code = exc.code
+    if isinstance(code, int):
+        # No JSON error body: postgrest-py puts the HTTP status in `code`.
+        return code >= 500
+    if not code:
+        return False
+    if code.startswith("PGRST"):
+        return code in _TRANSIENT_POSTGREST_CODES
+    return code[:2] in _TRANSIENT_SQLSTATE_CLASSES
+
+
+def _log_dropped_events(events: List[Tuple[Dict[str, Any], List[str]]], reason: str) -> None:
+    logger.error(
+        "[replicate_webhook] Dropping %d event(s) (%s): %s",
+        len(events),
+        reason,
+        ", ".join(
+            f"{update_payload['prediction_id']}={update_payload.get('status')}"
+            for update_payload, _ in events
+        ),
+    )
+
+
+async def _persist_webhook_group(events: List[Tuple[Dict[str, Any], List[str]]]) -> None:
+    """
+    Write one column group, retrying transient failures (`_WEBHOOK_WRITE_ATTEMPTS`
+    in all). A permanently rejected group is split so only the offending event(s)
+    are dropped; nothing is raised, so the consumer moves on to the next group.
+    """
+    delay = _WEBHOOK_RETRY_INITIAL_DELAY_SECONDS
+    rejected: Optional[BaseException] = None
+    try:
+        for attempt in range(1, _WEBHOOK_WRITE_ATTEMPTS + 1):
+            try:
+                await _process_webhook_events(events)
+                return
+            except Exception as exc:
+                if not _is_transient_write_error(exc):
+                    rejected = exc.__cause__ or exc
+                    break
+                if attempt == _WEBHOOK_WRITE_ATTEMPTS:
+                    _log_dropped_events(events, f"still failing after {attempt} attempts")
+                    return
+                logger.warning(
+                    "[replicate_webhook] Write attempt %d failed for %d event(s); "
+                    "retrying in %.1fs",
+                    attempt,
+                    len(events),
+                    delay,
+                )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, _WEBHOOK_RETRY_MAX_DELAY_SECONDS)
+    except asyncio.CancelledError:
+        _log_dropped_events(events, "shutdown while retrying")
+        raise
+
+    if len(events) == 1:
+        _log_dropped_events(events, f"rejected: {rejected}")
+        return
+    for event in events:
+        await _persist_webhook_group([event])
+
+
+async def _persist_webhook_batch(events: List[Tuple[Dict[str, Any], List[str]]]) -> None:
+    """
+    Write a drained batch of queued events with as few upserts as possible.
+    Events for the same prediction are merged in arrival order (later fields win),
+    then grouped by column set: a bulk upsert sends one column list for every
+    row, so rows without e.g. `metadata` must not share a request with rows
+    that have it (PostgREST would null the missing column).
+    """
+    merged: Dict[str, Tuple[Dict[str, Any], List[str]]] = {}
+    for update_payload, urls in events:
+        previous = merged.get(update_payload["prediction_id"])
+        if previous is not None:
+            update_payload = {**previous[0], **update_payload}
+            urls = urls or previous[1]
+        merged[update_payload["prediction_id"]] = (update_payload, urls)
+
+    groups: Dict[Tuple[str, ...], List[Tuple[Dict[str, Any], List[str]]]] = {}
+    for event in merged.values():
+        groups.setdefault(tuple(sorted(event[0])), []).append(event)
+
+    for group in groups.values():
+        await _persist_webhook_group(group)
+
+
+async def _webhook_consumer(queue: "asyncio.Queue[Tuple[Dict[str, Any], List[str]]]") -> None:
+    """
+    Drain queued webhook events in batches: up to `_WEBHOOK_BATCH_SIZE` events, or
+    whatever arrived within `_WEBHOOK_BATCH_WINDOW_SECONDS` of the first one.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        flush_at = loop.time() + _WEBHOOK_BATCH_WINDOW_SECONDS
+        while len(batch) < _WEBHOOK_BATCH_SIZE:
+            try:
+                batch.append(queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = flush_at - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        try:
+            await _persist_webhook_batch(batch)
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+
+async def start_webhook_consumer() -> None:
+    """Create the webhook queue and its consumer task (called from the app lifespan)."""
+    global _WEBHOOK_QUEUE, _WEBHOOK_CONSUMER
+    if _WEBHOOK_CONSUMER is not None:
+        return
+    _WEBHOOK_QUEUE = asyncio.Queue(maxsize=_WEBHOOK_QUEUE_SIZE)
+    _WEBHOOK_CONSUMER = asyncio.create_task(_webhook_consumer(_WEBHOOK_QUEUE))
+
+
+async def stop_webhook_consumer(timeout: float = 8.0) -> None:
+    """
+    Drain queued events and in-flight asset uploads (bounded by `timeout`, to fit
+    Cloud Run's shutdown grace period), then stop the consumer.
+    """
+    global _WEBHOOK_QUEUE, _WEBHOOK_CONSUMER
+    if _WEBHOOK_CONSUMER is None or _WEBHOOK_QUEUE is None:
+        return
+    deadline = time.monotonic() + timeout
+    try:
+        await asyncio.wait_for(_WEBHOOK_QUEUE.join(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(
+            "[replicate_webhook] %d queued event(s) not processed at shutdown",
+            _WEBHOOK_QUEUE.qsize(),
+        )
+    _WEBHOOK_CONSUMER.cancel()
+    _WEBHOOK_CONSUMER = None
+    _WEBHOOK_QUEUE = None
+
+    remaining = deadline - time.monotonic()
+    if _ASSET_TASKS and remaining > 0:
+        await asyncio.wait(set(_ASSET_TASKS), timeout=remaining)
+
+
+async def _read_webhook_body(request: Request) -> bytes:
+    """
+    Read the raw body, refusing it with 413 as soon as it exceeds
+    `_MAX_WEBHOOK_BODY_BYTES`: up front from Content-Length when announced,
+    otherwise while streaming (chunked requests).
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is not None:
+        try:
+            announced = int(content_length)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length") from exc
+        if announced > _MAX_WEBHOOK_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="Webhook payload too large")
+
+    chunks: List[bytes] = []
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > _MAX_WEBHOOK_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="Webhook payload too large")
+        chunks.append(chunk)
+    return b"".join(chunks)
 
 
-# ---------- Webhook receiver ----------
 @router.post("/webhooks/replicate")
 async def replicate_webhook(request: Request):
-    payload = await request.json()
+    body = await _read_webhook_body(request)
+    _verify_webhook_signature(request, body)
+
+    try:
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError as exc:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload") from exc
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Webhook payload must be a JSON object")
 
     prediction_id = payload.get("id")
     status = payload.get("status")
@@ -575,6 +1333,8 @@ async def replicate_webhook(request: Request):
     normalized_status = normalized_status_raw.lower()
     update_payload: Dict[str, Any] = {
         "prediction_id": prediction_id,
+        # Only written when the webhook creates the row (see _WEBHOOK_INSERT_ONLY_FIELDS).
+        "model": payload.get("model") or payload.get("version") or "unknown",
         "status": normalized_status,
         "output": payload.get("output"),
         "error_message": payload.get("error"),
@@ -585,79 +1345,33 @@ async def replicate_webhook(request: Request):
     if metadata_from_payload is not None:
         update_payload["metadata"] = metadata_from_payload
 
-    if normalized_status in {"succeeded", "failed", "canceled", "completed"}:
+    if normalized_status in _TERMINAL_STATUSES:
         update_payload["completed_at"] = update_payload["updated_at"]
 
-    supabase = get_supabase_client()
-    try:
-        response = (
-            supabase.table("replicate_jobs")
-            .update(update_payload)
-            .eq("prediction_id", prediction_id)
-            .execute()
-        )
-    except Exception as exc:
-        print(
-            f"[replicate_webhook] Failed to update prediction {prediction_id}: {exc}"
-        )
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to update replicate job: {exc}",
-        ) from exc
-
-    data = _response_data(response)
-
-    if not data:
-        print(
-            f"[replicate_webhook] Prediction {prediction_id} not found when updating; "
-            "attempting to insert fallback record."
-        )
-        try:
-            insert_payload = {"prediction_id": prediction_id, **update_payload}
-            response = supabase.table("replicate_jobs").insert(insert_payload).execute()
-            data = _response_data(response)
-        except Exception as exc:
-            print(
-                f"[replicate_webhook] Fallback insert failed for prediction {prediction_id}: {exc}"
-            )
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to persist replicate job: {exc}",
-            ) from exc
-
-    job_response = (
-        supabase.table("replicate_jobs")
-        .select("id, user_id, prompt, metadata")
-        .eq("prediction_id", prediction_id)
-        .limit(1)
-        .execute()
-    )
-    job_data = _response_data(job_response)
-    job_record = job_data[0] if job_data else None
-
-    success_statuses = {"succeeded", "completed", "success"}
     urls = _extract_output_urls(payload.get("output"))
     if not urls and payload.get("urls"):
         urls = _extract_output_urls(payload.get("urls"))
 
-    if job_record and urls and normalized_status in success_statuses:
-        await _store_assets_for_prediction(supabase, job_record, prediction_id, urls)
-    elif not job_record:
-        print(
-            f"[replicate_webhook] Unable to load job record for prediction {prediction_id}; "
-            "skipping asset persistence."
-        )
-
-    print(
-        f"[replicate_webhook] Updated prediction {prediction_id} "
-        f"status={normalized_status} job_updated={bool(data)}"
-    )
+    # Acknowledge before any DB work: the consumer persists the event. Without a
+    # running consumer, or when it is backed up, process inline so the event is
+    # never lost (a 500 there lets Replicate retry).
+    if _WEBHOOK_QUEUE is not None:
+        try:
+            _WEBHOOK_QUEUE.put_nowait((update_payload, urls))
+        except asyncio.QueueFull:
+            pass
+        else:
+            return ORJSONResponse(
+                {"ok": True, "prediction_id": prediction_id, "status": normalized_status},
+                status_code=202,
+            )
 
-    return JSONResponse(
+    job_updated = await _process_webhook_events([(update_payload, urls)]) > 0
+    return ORJSONResponse(
         {
             "ok": True,
             "prediction_id": prediction_id,
             "status": normalized_status,
-            "job_updated": bool(data),
+            "job_updated": job_updated,
         }
     )
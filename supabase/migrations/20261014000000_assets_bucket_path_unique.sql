@@ -0,0 +1,69 @@
+-- One row per stored object: lets the Replicate webhook upsert assets on
+-- (bucket, path) instead of selecting existing rows first.
+-- PostgREST `on_conflict` only accepts plain columns, so the key is the
+-- deterministic storage path rather than metadata->>'external_url'.
+
+-- Duplicate rows and the row kept for their (bucket, path): the earliest one.
+create temporary table asset_dedupe as
+select id as duplicate_id, keeper_id
+from (
+  select id,
+         first_value(id) over (partition by bucket, path order by created_at, id) as keeper_id
+  from public.assets
+) ranked
+where id <> keeper_id;
+
+-- asset_derivatives is the only table referencing assets (see bdd.md); refuse to
+-- run rather than cascade into, or trip over, a reference this migration ignores.
+do $$
+begin
+  if exists (
+    select 1
+    from pg_constraint
+    where contype = 'f'
+      and confrelid = 'public.assets'::regclass
+      and conrelid <> 'public.asset_derivatives'::regclass
+  ) then
+    raise exception 'assets is referenced by a table other than asset_derivatives; '
+                    'repoint it to the kept rows before deduplicating';
+  end if;
+end
+$$;
+
+-- Repoint derivative links to the kept rows. Links that would duplicate an
+-- existing one, or become a self-link (two copies of the same object), are dropped.
+with moved as (
+  delete from public.asset_derivatives d
+  where d.parent_asset_id in (select duplicate_id from asset_dedupe)
+     or d.child_asset_id in (select duplicate_id from asset_dedupe)
+  returning d.parent_asset_id, d.child_asset_id, d.relation
+), repointed as (
+  select distinct
+         coalesce(p.keeper_id, m.parent_asset_id) as parent_asset_id,
+         coalesce(c.keeper_id, m.child_asset_id) as child_asset_id,
+         m.relation
+  from moved m
+  left join asset_dedupe p on p.duplicate_id = m.parent_asset_id
+  left join asset_dedupe c on c.duplicate_id = m.child_asset_id
+)
+insert into public.asset_derivatives (parent_asset_id, child_asset_id, relation)
+select r.parent_asset_id, r.child_asset_id, r.relation
+from repointed r
+where r.parent_asset_id <> r.child_asset_id
+  and not exists (
+    select 1
+    from public.asset_derivatives e
+    where e.parent_asset_id = r.parent_asset_id
+      and e.child_asset_id = r.child_asset_id
+      and e.relation = r.relation
+  )
+on conflict do nothing;
+
+delete from public.assets a
+using asset_dedupe d
+where a.id = d.duplicate_id;
+
+drop table asset_dedupe;
+
+alter table public.assets
+  add constraint assets_bucket_path_key unique (bucket, path);
@@ -0,0 +1,20 @@
+-- The Replicate webhook upserts on prediction_id, which needs a unique index.
+-- Duplicates come from the old webhook fallback: it inserted a row (without
+-- user_id) only when the webhook beat the create insert, so that row is the
+-- earlier one. Keep the attributed row of any duplicates (user_id set), then
+-- the earliest.
+
+delete from public.replicate_jobs a
+using (
+  select id,
+         first_value(id) over (
+           partition by prediction_id
+           order by (user_id is null), created_at, id
+         ) as keeper_id
+  from public.replicate_jobs
+) ranked
+where a.id = ranked.id
+  and ranked.id <> ranked.keeper_id;
+
+create unique index if not exists replicate_jobs_prediction_id_key
+  on public.replicate_jobs (prediction_id);
@@ -0,0 +1,13 @@
+-- Folder resolution (routers/replicate_ai.py) filters folders by
+-- (user_id, path) for every path segment, and by (id, user_id) for folder_id.
+-- The id lookup is already a unique seek on the primary key; the path lookup
+-- gets a composite btree (ltree has a btree opclass for equality).
+-- folder_tree is a view over folders, so it is served by the same index.
+--
+-- Verify with:
+--   explain analyze select id from public.folders
+--   where user_id = '<uuid>' and path = 'a.b.c' limit 1;
+-- which should show an Index Scan using idx_folders_user_id_path.
+
+create index if not exists idx_folders_user_id_path
+  on public.folders (user_id, path);
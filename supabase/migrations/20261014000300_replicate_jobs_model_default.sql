@@ -0,0 +1,9 @@
+-- The Replicate webhook updates existing jobs without sending `model`, so the
+-- model recorded at creation is never overwritten. Postgres checks NOT NULL on
+-- the proposed row before resolving ON CONFLICT, so the column needs a default
+-- for that upsert to reach its DO UPDATE. The webhook inserts missing rows with
+-- their model first, so no row ends up with the default through that path.
+-- 'unknown' is what the webhook already stores when a payload has no model.
+
+alter table public.replicate_jobs
+  alter column model set default 'unknown';
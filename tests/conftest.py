@@ -0,0 +1,11 @@
+import os
+
+# core.config builds Settings at import time; give the required fields
+# placeholder values so the modules under test can be imported without a .env.
+for _name, _value in {
+    "REPLICATE_API_TOKEN": "r8_test",
+    "SUPABASE_URL": "https://test.supabase.co",
+    "SUPABASE_SERVICE_ROLE_KEY": "service-role-test",
+    "SUPABASE_JWT_SECRET": "test-jwt-secret-of-at-least-32-bytes",
+}.items():
+    os.environ.setdefault(_name, _value)
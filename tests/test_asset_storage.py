@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import routers.replicate_ai as replicate_ai
+
+
+def test_failed_asset_storage_is_logged_with_the_prediction(monkeypatch, caplog):
+    async def failing_store(supabase, job, prediction_id, urls):
+        raise HTTPException(status_code=500, detail="Unable to check folder path 'a'")
+
+    monkeypatch.setattr(replicate_ai, "_store_assets_for_prediction", failing_store)
+
+    async def scenario():
+        replicate_ai._spawn_asset_storage(None, {}, "pred-1", ["https://cdn/x.png"])
+        await asyncio.gather(*replicate_ai._ASSET_TASKS, return_exceptions=True)
+        await asyncio.sleep(0)  # let the done-callback run
+
+    asyncio.run(scenario())
+
+    assert not replicate_ai._ASSET_TASKS
+    assert "Asset storage failed for prediction pred-1" in caplog.text
+    assert "never retrieved" not in caplog.text
+
+
+@pytest.mark.parametrize(
+    "url, ext",
+    [
+        ("https://cdn.example.com", ".png"),
+        ("https://cdn.example.com/", ".png"),
+        ("https://cdn.example.com?x=1.jpg", ".png"),
+        ("https://cdn.example.com#a.gif", ".png"),
+        ("https://replicate.delivery/xezq/abc/out-0.webp", ".webp"),
+        ("https://cdn.example.com/a/out.jpeg?token=1.2#frag.z", ".jpeg"),
+        ("https://cdn.example.com/a.b/file", ".png"),
+        ("https://cdn.example.com/.hidden", ".png"),
+        ("https://user@cdn.example.com:8443/x.png", ".png"),
+    ],
+)
+def test_asset_extension_comes_from_the_url_path(url, ext):
+    fileinfo = replicate_ai._build_asset_fileinfo("pred-1", 0, url, "user-1")
+    assert fileinfo["filename"] == f"pred-1_0{ext}"
+    assert fileinfo["path"] == f"user-1/pred-1/pred-1_0{ext}"
+
+
+def test_asset_path_includes_the_folder():
+    fileinfo = replicate_ai._build_asset_fileinfo(
+        "pred-1", 2, "https://cdn.example.com/o.jpg", "user-1", folder_path="a/b"
+    )
+    assert fileinfo == {"filename": "pred-1_2.jpg", "path": "user-1/a/b/pred-1/pred-1_2.jpg"}
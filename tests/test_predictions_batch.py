@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from replicate.exceptions import ModelError, ReplicateError
+
+import main
+import routers.replicate_ai as replicate_ai
+from tests.test_security_fast import _make_token
+
+
+@pytest.fixture
+def replicate_creates(monkeypatch):
+    """Stub Replicate: each item's prompt picks its outcome (an exception is raised)."""
+    outcomes: Dict[str, Any] = {}
+    jobs: List[Dict[str, Any]] = []
+
+    async def async_create(*, input: Dict[str, Any], **kwargs: Any) -> Any:
+        outcome = outcomes[input["prompt"]]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def fake_insert_job(record: Dict[str, Any]) -> None:
+        jobs.append(record)
+
+    client = SimpleNamespace(predictions=SimpleNamespace(async_create=async_create))
+    monkeypatch.setattr(replicate_ai, "get_replicate_client", lambda: client)
+    monkeypatch.setattr(replicate_ai, "get_async_supabase_client", lambda: None)
+    monkeypatch.setattr(replicate_ai, "_insert_job", fake_insert_job)
+    monkeypatch.setitem(
+        replicate_ai.settings.__dict__, "WEBHOOK_URL", "https://api.test/ai/webhooks/replicate"
+    )
+    return SimpleNamespace(outcomes=outcomes, jobs=jobs)
+
+
+def _batch(prompts: List[str]):
+    return TestClient(main.app).post(
+        "/ai/ideogram/predictions:batch",
+        json={"items": [{"prompt": prompt} for prompt in prompts]},
+        headers={"Authorization": f"Bearer {_make_token()}"},
+    )
+
+
+def test_one_failed_item_does_not_fail_the_others(replicate_creates):
+    replicate_creates.outcomes.update(
+        {
+            "ok-1": SimpleNamespace(id="p1", status="starting"),
+            "rate-limited": ReplicateError(status=429, detail="Request was throttled"),
+            "ok-2": SimpleNamespace(id="p2", status="starting"),
+        }
+    )
+
+    response = _batch(["ok-1", "rate-limited", "ok-2"])
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"prediction_id": "p1", "status": "starting"},
+        {"error": "Request was throttled", "status": 429},
+        {"prediction_id": "p2", "status": "starting"},
+    ]
+    # Only the created predictions are recorded.
+    assert [job["prediction_id"] for job in replicate_creates.jobs] == ["p1", "p2"]
+
+
+@pytest.mark.parametrize(
+    "exc, expected",
+    [
+        (ReplicateError(status=401, detail="Unauthenticated"), (502, "Unauthenticated")),
+        (ReplicateError(status=422, detail="Invalid input"), (422, "Invalid input")),
+        (ModelError(SimpleNamespace(error="NSFW content")), (400, "NSFW content")),
+        (httpx.ReadTimeout("timed out"), (504, "Replicate request timed out")),
+        (httpx.ConnectError("refused"), (502, "Replicate unreachable: refused")),
+        (RuntimeError("secret internals"), (500, "Prediction creation failed")),
+    ],
+)
+def test_item_errors_are_mapped_like_single_creates(replicate_creates, exc, expected):
+    replicate_creates.outcomes["failing"] = exc
+
+    [result] = _batch(["failing"]).json()
+
+    assert (result["status"], result["error"]) == expected
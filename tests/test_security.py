@@ -0,0 +1,51 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import core.security as security
+import core.security_fast as security_fast
+from tests.test_security_fast import _make_token
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    security._JWT_CACHE.clear()
+    security._BAD_TOKENS.clear()
+    yield
+    security._JWT_CACHE.clear()
+    security._BAD_TOKENS.clear()
+
+
+def _rejected(token: str) -> str:
+    with pytest.raises(HTTPException) as excinfo:
+        security._decode_token(token)
+    assert excinfo.value.status_code == 401
+    return excinfo.value.detail
+
+
+def test_token_ahead_of_our_clock_is_accepted_once_valid(monkeypatch):
+    issued_at = int(time.time()) + 2
+    token = _make_token({"iat": issued_at, "nbf": issued_at})
+    assert "not yet valid" in _rejected(token)
+    assert not security._BAD_TOKENS
+
+    monkeypatch.setattr(security_fast.time, "time", lambda: issued_at + 1)
+    assert security._decode_token(token).user_id == "user-1"
+
+
+def test_expired_token_is_not_negatively_cached():
+    _rejected(_make_token({"exp": int(time.time()) - 10}))
+    assert not security._BAD_TOKENS
+
+
+def test_bad_signature_is_negatively_cached(monkeypatch):
+    token = _make_token(secret=b"not-the-supabase-secret-at-all-xx")
+    detail = _rejected(token)
+    assert security._BAD_TOKENS
+
+    def fail(*args, **kwargs):
+        raise AssertionError("cached rejection re-verified the token")
+
+    monkeypatch.setattr(security, "_verify_hs256", fail)
+    assert _rejected(token) == detail
@@ -0,0 +1,163 @@
+import base64
+import hashlib
+import hmac
+import time
+from typing import Any, Dict, Optional
+
+import orjson
+import pytest
+
+from core.security_fast import (
+    AUD,
+    ISS,
+    SECRET_BYTES,
+    ExpiredTokenError,
+    InvalidTokenError,
+    _verify_hs256,
+)
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _make_token(
+    claims: Optional[Dict[str, Any]] = None,
+    header: Optional[Dict[str, Any]] = None,
+    secret: bytes = SECRET_BYTES,
+) -> str:
+    """Sign `claims` (merged over valid defaults) as an HS256 JWT."""
+    payload: Dict[str, Any] = {"sub": "user-1", "exp": int(time.time()) + 600}
+    if AUD:
+        payload["aud"] = AUD
+    if ISS:
+        payload["iss"] = ISS
+    payload.update(claims or {})
+    header_b64 = _b64url(orjson.dumps(header or {"alg": "HS256", "typ": "JWT"}))
+    payload_b64 = _b64url(orjson.dumps(payload))
+    signature = hmac.new(secret, f"{header_b64}.{payload_b64}".encode(), hashlib.sha256)
+    return f"{header_b64}.{payload_b64}.{_b64url(signature.digest())}"
+
+
+def test_valid_token_returns_payload():
+    payload = _verify_hs256(_make_token({"role": "authenticated"}), SECRET_BYTES)
+    assert payload["sub"] == "user-1"
+    assert payload["role"] == "authenticated"
+
+
+@pytest.mark.parametrize("alg", ["none", "HS512", "RS256"])
+def test_rejects_other_algorithms(alg):
+    token = _make_token(header={"alg": alg, "typ": "JWT"})
+    with pytest.raises(InvalidTokenError, match="alg"):
+        _verify_hs256(token, SECRET_BYTES)
+
+
+def test_rejects_unsigned_token():
+    header_b64, payload_b64, _ = _make_token(header={"alg": "none"}).split(".")
+    with pytest.raises(InvalidTokenError):
+        _verify_hs256(f"{header_b64}.{payload_b64}.", SECRET_BYTES)
+
+
+def test_rejects_bad_signature():
+    with pytest.raises(InvalidTokenError, match="Signature"):
+        _verify_hs256(_make_token(secret=b"another-secret"), SECRET_BYTES)
+
+
+@pytest.mark.parametrize("suffix", ["!!", "==", "+", "/", " ", "A"])
+def test_rejects_junk_suffixed_signature(suffix):
+    with pytest.raises(InvalidTokenError):
+        _verify_hs256(_make_token() + suffix, SECRET_BYTES)
+
+
+def test_rejects_standard_base64_alphabet():
+    # Pick a token whose signature uses a URL-safe-only character.
+    token = next(
+        token
+        for token in (_make_token({"n": n}) for n in range(1000))
+        if "-" in token.rsplit(".", 1)[1] or "_" in token.rsplit(".", 1)[1]
+    )
+    header_b64, payload_b64, signature_b64 = token.split(".")
+    translated = signature_b64.replace("-", "+").replace("_", "/")
+    with pytest.raises(InvalidTokenError):
+        _verify_hs256(f"{header_b64}.{payload_b64}.{translated}", SECRET_BYTES)
+
+
+def test_rejects_expired_token():
+    with pytest.raises(ExpiredTokenError):
+        _verify_hs256(_make_token({"exp": int(time.time()) - 10}), SECRET_BYTES)
+
+
+def test_rejects_future_nbf():
+    with pytest.raises(InvalidTokenError, match="nbf"):
+        _verify_hs256(_make_token({"nbf": int(time.time()) + 600}), SECRET_BYTES)
+
+
+def test_rejects_future_iat():
+    with pytest.raises(InvalidTokenError, match="iat"):
+        _verify_hs256(_make_token({"iat": int(time.time()) + 600}), SECRET_BYTES)
+
+
+@pytest.mark.skipif(not AUD, reason="no audience configured")
+def test_rejects_wrong_audience():
+    with pytest.raises(InvalidTokenError, match="Audience"):
+        _verify_hs256(_make_token({"aud": "someone-else"}), SECRET_BYTES)
+
+
+@pytest.mark.skipif(not AUD, reason="no audience configured")
+def test_accepts_audience_list():
+    payload = _verify_hs256(_make_token({"aud": ["other", AUD]}), SECRET_BYTES)
+    assert AUD in payload["aud"]
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        "",
+        "abc",
+        "a.b",
+        "a.b.c.d",
+        "!!!.e30.sig",
+        "e30.e30",
+        f"{_b64url(b'[1]')}.{_b64url(b'{}')}.sig",
+        f"{_b64url(b'not json')}.{_b64url(b'{}')}.sig",
+    ],
+)
+def test_rejects_malformed_segments(token):
+    with pytest.raises(InvalidTokenError):
+        _verify_hs256(token, SECRET_BYTES)
+
+
+@pytest.mark.parametrize("claim", ["exp", "nbf", "iat"])
+@pytest.mark.parametrize("value", ["1700000000", True, [1], {"t": 1}])
+def test_rejects_non_numeric_time_claims(claim, value):
+    with pytest.raises(InvalidTokenError, match=claim):
+        _verify_hs256(_make_token({claim: value}), SECRET_BYTES)
+
+
+def test_matches_pyjwt_on_valid_token():
+    jwt = pytest.importorskip("jwt")
+    claims = {"sub": "user-1", "iat": int(time.time()) - 5, "nbf": int(time.time()) - 5}
+    if AUD:
+        claims["aud"] = AUD
+    if ISS:
+        claims["iss"] = ISS
+    claims["exp"] = int(time.time()) + 600
+    token = jwt.encode(claims, SECRET_BYTES, algorithm="HS256")
+
+    expected = jwt.decode(
+        token,
+        SECRET_BYTES,
+        algorithms=["HS256"],
+        audience=AUD,
+        issuer=ISS,
+    )
+    assert _verify_hs256(token, SECRET_BYTES) == expected
+
+
+def test_pyjwt_rejects_what_we_reject():
+    jwt = pytest.importorskip("jwt")
+    token = _make_token() + "!!"
+    with pytest.raises(jwt.InvalidTokenError):
+        jwt.decode(token, SECRET_BYTES, algorithms=["HS256"], audience=AUD, issuer=ISS)
+    with pytest.raises(InvalidTokenError):
+        _verify_hs256(token, SECRET_BYTES)
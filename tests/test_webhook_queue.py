@@ -0,0 +1,276 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Any, Dict, List, Tuple
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from postgrest.exceptions import APIError
+
+import main
+import routers.replicate_ai as replicate_ai
+
+Event = Tuple[Dict[str, Any], List[str]]
+
+
+def _event(prediction_id: str, status: str = "processing", **fields: Any) -> Event:
+    return {"prediction_id": prediction_id, "status": status, **fields}, []
+
+
+def _write_error(cause: BaseException) -> HTTPException:
+    """What `_process_webhook_events` raises: a 500 chained to the client error."""
+    error = HTTPException(status_code=500, detail=f"Failed to persist replicate job: {cause}")
+    error.__cause__ = cause
+    return error
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    """Record every `_process_webhook_events` call; failures are scripted per test."""
+    calls: List[List[str]] = []
+    written: List[List[Event]] = []
+    failures: Dict[str, List[BaseException]] = {}
+
+    async def fake_process(events: List[Event]) -> int:
+        ids = [update_payload["prediction_id"] for update_payload, _ in events]
+        calls.append(ids)
+        written.append(events)
+        for prediction_id in ids:
+            pending = failures.get(prediction_id)
+            if pending:
+                raise _write_error(pending.pop(0))
+        return len(events)
+
+    monkeypatch.setattr(replicate_ai, "_process_webhook_events", fake_process)
+    monkeypatch.setattr(replicate_ai, "_WEBHOOK_RETRY_INITIAL_DELAY_SECONDS", 0)
+    return SimpleNamespace(calls=calls, written=written, failures=failures)
+
+
+@pytest.mark.parametrize(
+    "cause",
+    [
+        httpx.ConnectError("connection refused"),
+        httpx.ReadTimeout("timed out"),
+        APIError({"code": "PGRST001", "message": "could not connect"}),
+        APIError({"code": "40P01", "message": "deadlock detected"}),
+        APIError({"code": 503, "message": "JSON could not be generated"}),
+    ],
+)
+def test_transient_errors_are_retried(cause):
+    assert replicate_ai._is_transient_write_error(_write_error(cause))
+
+
+@pytest.mark.parametrize(
+    "cause",
+    [
+        APIError({"code": "23502", "message": "null value in column"}),
+        APIError({"code": "PGRST204", "message": "column not found"}),
+        APIError({"code": 400, "message": "JSON could not be generated"}),
+        ValueError("unexpected"),
+    ],
+)
+def test_permanent_errors_are_not_retried(cause):
+    assert not replicate_ai._is_transient_write_error(_write_error(cause))
+
+
+def test_transient_failure_is_retried_until_written(writes):
+    writes.failures["p1"] = [httpx.ConnectError("down")] * 3
+    asyncio.run(replicate_ai._persist_webhook_batch([_event("p1")]))
+    assert writes.calls == [["p1"]] * 4
+
+
+def test_transient_failure_gives_up_after_bounded_attempts(writes, caplog):
+    writes.failures["p1"] = [httpx.ConnectError("down")] * 100
+    asyncio.run(replicate_ai._persist_webhook_batch([_event("p1")]))
+    assert len(writes.calls) == replicate_ai._WEBHOOK_WRITE_ATTEMPTS
+    assert "Dropping 1 event(s)" in caplog.text
+    assert "p1=processing" in caplog.text
+
+
+def test_rejected_event_is_dropped_without_blocking_the_others(writes, caplog):
+    writes.failures["bad"] = [APIError({"code": "23514", "message": "check violation"})] * 2
+    asyncio.run(
+        replicate_ai._persist_webhook_batch([_event("ok-1"), _event("bad"), _event("ok-2")])
+    )
+    # One bulk attempt, then each event on its own: only `bad` is lost.
+    assert writes.calls == [["ok-1", "bad", "ok-2"], ["ok-1"], ["bad"], ["ok-2"]]
+    assert "Dropping 1 event(s) (rejected" in caplog.text
+    assert "bad=processing" in caplog.text
+
+
+def test_events_for_one_prediction_are_merged_in_arrival_order(writes):
+    asyncio.run(
+        replicate_ai._persist_webhook_batch(
+            [
+                ({"prediction_id": "p1", "status": "processing", "output": None}, []),
+                ({"prediction_id": "p1", "status": "succeeded", "output": ["u"]}, ["u"]),
+                ({"prediction_id": "p1", "status": "succeeded", "output": ["u"]}, []),
+            ]
+        )
+    )
+    [[(update_payload, urls)]] = writes.written
+    assert update_payload == {"prediction_id": "p1", "status": "succeeded", "output": ["u"]}
+    # A later event without outputs keeps the URLs an earlier one carried.
+    assert urls == ["u"]
+
+
+def test_events_are_grouped_by_column_set(writes):
+    asyncio.run(
+        replicate_ai._persist_webhook_batch(
+            [
+                _event("a"),
+                _event("b", metadata={"k": "v"}),
+                _event("c"),
+                _event("d", metadata={"k": "w"}),
+            ]
+        )
+    )
+    # Rows with and without `metadata` never share a bulk upsert.
+    assert sorted(writes.calls) == [["a", "c"], ["b", "d"]]
+    for events in writes.written:
+        assert len({tuple(sorted(update_payload)) for update_payload, _ in events}) == 1
+
+
+class _FakeJobsTable:
+    """`replicate_jobs` keyed by prediction_id, for the upserts the webhook sends."""
+
+    def __init__(self, rows: Dict[str, Dict[str, Any]]) -> None:
+        self.rows = rows
+        self.upserts: List[Tuple[List[Dict[str, Any]], bool]] = []
+
+    def upsert(self, rows, *, on_conflict, ignore_duplicates=False, **kwargs):
+        assert on_conflict == "prediction_id"
+        self.upserts.append((rows, ignore_duplicates))
+        self._written = []
+        for row in rows:
+            existing = self.rows.get(row["prediction_id"])
+            if existing is None:
+                # NOT NULL is checked on the proposed row, conflict or not.
+                self.rows[row["prediction_id"]] = {"model": "unknown", **row}
+            elif not ignore_duplicates:
+                existing.update(row)
+            else:
+                continue
+            self._written.append(self.rows[row["prediction_id"]])
+        return self
+
+    def select(self, columns):
+        return self
+
+    async def execute(self):
+        return SimpleNamespace(data=self._written)
+
+
+def test_webhook_keeps_the_model_recorded_at_creation(monkeypatch):
+    table = _FakeJobsTable(
+        {"created": {"prediction_id": "created", "model": replicate_ai.MODEL_ID, "user_id": "u"}}
+    )
+    supabase = SimpleNamespace(table=lambda name: table)
+    monkeypatch.setattr(replicate_ai, "get_async_supabase_client", lambda: supabase)
+
+    written = asyncio.run(
+        replicate_ai._process_webhook_events(
+            [_event("created", model="owner/other"), _event("new", model="owner/other")]
+        )
+    )
+
+    assert written == 2
+    assert table.rows["created"]["model"] == replicate_ai.MODEL_ID
+    assert table.rows["created"]["status"] == "processing"
+    # A row the webhook creates gets the payload's model.
+    assert table.rows["new"]["model"] == "owner/other"
+    [(inserts, inserts_ignore_duplicates), (updates, updates_ignore_duplicates)] = table.upserts
+    assert (inserts_ignore_duplicates, updates_ignore_duplicates) == (True, False)
+    assert all("model" in row for row in inserts)
+    assert not any("model" in row for row in updates)
+
+
+def _run_consumer(monkeypatch, feed):
+    """Run the consumer while `feed(queue)` enqueues; return the batches it drained."""
+    batches: List[List[str]] = []
+
+    async def fake_persist(events: List[Event]) -> None:
+        batches.append([update_payload["prediction_id"] for update_payload, _ in events])
+
+    async def scenario() -> None:
+        queue: "asyncio.Queue[Event]" = asyncio.Queue()
+        consumer = asyncio.create_task(replicate_ai._webhook_consumer(queue))
+        await feed(queue)
+        await asyncio.wait_for(queue.join(), 2)
+        consumer.cancel()
+
+    monkeypatch.setattr(replicate_ai, "_persist_webhook_batch", fake_persist)
+    asyncio.run(scenario())
+    return batches
+
+
+def test_consumer_caps_batches_at_batch_size(monkeypatch):
+    monkeypatch.setattr(replicate_ai, "_WEBHOOK_BATCH_SIZE", 2)
+
+    async def feed(queue):
+        for index in range(5):
+            queue.put_nowait(_event(f"p{index}"))
+
+    assert _run_consumer(monkeypatch, feed) == [["p0", "p1"], ["p2", "p3"], ["p4"]]
+
+
+def test_consumer_flushes_after_the_batch_window(monkeypatch):
+    monkeypatch.setattr(replicate_ai, "_WEBHOOK_BATCH_WINDOW_SECONDS", 0.2)
+
+    async def feed(queue):
+        queue.put_nowait(_event("p1"))
+        await asyncio.sleep(0.05)
+        queue.put_nowait(_event("p2"))  # within the window of p1
+        await asyncio.sleep(0.4)
+        queue.put_nowait(_event("p3"))  # after that batch was flushed
+
+    assert _run_consumer(monkeypatch, feed) == [["p1", "p2"], ["p3"]]
+
+
+def _webhook(client: TestClient, prediction_id: str):
+    return client.post(
+        "/ai/webhooks/replicate",
+        json={"id": prediction_id, "status": "succeeded", "model": replicate_ai.MODEL_ID},
+    )
+
+
+@pytest.fixture
+def no_webhook_secret(monkeypatch):
+    monkeypatch.setattr(replicate_ai.settings, "REPLICATE_WEBHOOK_SECRET", None)
+
+
+def test_webhook_is_queued_and_acknowledged_with_202(monkeypatch, writes, no_webhook_secret):
+    queue: "asyncio.Queue[Event]" = asyncio.Queue(maxsize=1)
+    monkeypatch.setattr(replicate_ai, "_WEBHOOK_QUEUE", queue)
+
+    response = _webhook(TestClient(main.app), "p1")
+
+    assert response.status_code == 202
+    assert queue.qsize() == 1
+    assert writes.calls == []
+
+
+def test_webhook_is_processed_inline_when_the_queue_is_full(
+    monkeypatch, writes, no_webhook_secret
+):
+    queue: "asyncio.Queue[Event]" = asyncio.Queue(maxsize=1)
+    queue.put_nowait(_event("backlog"))
+    monkeypatch.setattr(replicate_ai, "_WEBHOOK_QUEUE", queue)
+
+    response = _webhook(TestClient(main.app), "p1")
+
+    assert response.status_code == 200
+    assert response.json()["job_updated"] is True
+    assert writes.calls == [["p1"]]
+
+
+def test_inline_write_failure_answers_500_so_replicate_retries(
+    monkeypatch, writes, no_webhook_secret
+):
+    monkeypatch.setattr(replicate_ai, "_WEBHOOK_QUEUE", None)
+    writes.failures["p1"] = [httpx.ConnectError("down")]
+
+    response = _webhook(TestClient(main.app), "p1")
+
+    assert response.status_code == 500
@@ -0,0 +1,143 @@
+import base64
+import hashlib
+import hmac
+import time
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+import routers.replicate_ai as replicate_ai
+
+KEY = b"replicate-webhook-signing-key-32b!"
+SECRET = "whsec_" + base64.b64encode(KEY).decode()
+BODY = b'{"id":"pred-1","status":"succeeded"}'
+
+
+@pytest.fixture(autouse=True)
+def webhook_secret(monkeypatch):
+    monkeypatch.setattr(replicate_ai.settings, "REPLICATE_WEBHOOK_SECRET", SECRET)
+
+
+def _signature(body: bytes, webhook_id: str, timestamp: str, key: bytes = KEY) -> str:
+    digest = hmac.new(key, f"{webhook_id}.{timestamp}.".encode() + body, hashlib.sha256)
+    return "v1," + base64.b64encode(digest.digest()).decode()
+
+
+def _headers(
+    body: bytes = BODY,
+    webhook_id: str = "msg_1",
+    timestamp: Optional[str] = None,
+    key: bytes = KEY,
+) -> Dict[str, str]:
+    timestamp = timestamp or str(int(time.time()))
+    return {
+        "webhook-id": webhook_id,
+        "webhook-timestamp": timestamp,
+        "webhook-signature": _signature(body, webhook_id, timestamp, key),
+    }
+
+
+def _verify(headers: Dict[str, str], body: bytes = BODY) -> None:
+    replicate_ai._verify_webhook_signature(SimpleNamespace(headers=headers), body)
+
+
+def _rejected(headers: Dict[str, str], body: bytes = BODY) -> str:
+    with pytest.raises(HTTPException) as excinfo:
+        _verify(headers, body)
+    assert excinfo.value.status_code == 401
+    return excinfo.value.detail
+
+
+def test_valid_signature_is_accepted():
+    _verify(_headers())
+
+
+def test_secret_without_whsec_prefix_is_accepted(monkeypatch):
+    monkeypatch.setattr(
+        replicate_ai.settings, "REPLICATE_WEBHOOK_SECRET", base64.b64encode(KEY).decode()
+    )
+    _verify(_headers())
+
+
+def test_no_secret_configured_skips_verification(monkeypatch):
+    monkeypatch.setattr(replicate_ai.settings, "REPLICATE_WEBHOOK_SECRET", None)
+    _verify({})
+
+
+def test_wrong_secret_is_rejected():
+    assert "signature" in _rejected(_headers(key=b"some-other-signing-key-of-32-bytes"))
+
+
+def test_tampered_body_is_rejected():
+    assert "signature" in _rejected(_headers(), body=BODY.replace(b"succeeded", b"failed"))
+
+
+def test_signature_bound_to_webhook_id():
+    headers = _headers()
+    headers["webhook-id"] = "msg_2"
+    assert "signature" in _rejected(headers)
+
+
+@pytest.mark.parametrize("offset", [-3600, -301, 301, 3600])
+def test_stale_or_future_timestamp_is_rejected(offset):
+    # Correctly signed, so only the replay window can reject it.
+    headers = _headers(timestamp=str(int(time.time()) + offset))
+    assert "tolerance" in _rejected(headers)
+
+
+def test_timestamp_within_tolerance_is_accepted():
+    _verify(_headers(timestamp=str(int(time.time()) - 60)))
+
+
+def test_non_numeric_timestamp_is_rejected():
+    assert "timestamp" in _rejected(_headers(timestamp="yesterday"))
+
+
+@pytest.mark.parametrize("missing", ["webhook-id", "webhook-timestamp", "webhook-signature"])
+def test_missing_header_is_rejected(missing):
+    headers = _headers()
+    del headers[missing]
+    assert "Missing" in _rejected(headers)
+
+
+def test_any_of_several_v1_signatures_may_match():
+    headers = _headers()
+    stale = _signature(
+        BODY, "msg_1", headers["webhook-timestamp"], b"rotated-out-key-of-32-bytes-long!!"
+    )
+    headers["webhook-signature"] = f"{stale} {headers['webhook-signature']}"
+    _verify(headers)
+
+
+def test_only_v1_signatures_are_considered():
+    headers = _headers()
+    headers["webhook-signature"] = headers["webhook-signature"].replace("v1,", "v2,", 1)
+    assert "signature" in _rejected(headers)
+
+
+@pytest.mark.parametrize("suffix", ["!!", "*", "\\x00"])
+def test_junk_suffixed_signature_is_rejected(suffix):
+    headers = _headers()
+    headers["webhook-signature"] += suffix
+    assert "signature" in _rejected(headers)
+
+
+def test_route_rejects_unsigned_webhook_before_processing(monkeypatch):
+    async def must_not_run(events):
+        raise AssertionError("unsigned webhook reached persistence")
+
+    monkeypatch.setattr(replicate_ai, "_process_webhook_events", must_not_run)
+    monkeypatch.setattr(replicate_ai, "_WEBHOOK_QUEUE", None)
+    client = TestClient(main.app)
+
+    response = client.post("/ai/webhooks/replicate", content=BODY)
+    assert response.status_code == 401
+
+    response = client.post(
+        "/ai/webhooks/replicate", content=BODY, headers={**_headers(), "webhook-id": "msg_9"}
+    )
+    assert response.status_code == 401